@@ -34,12 +34,13 @@ add_user.py — 为“多用户财经早报系统”添加/更新用户的工具
 """
 
 import argparse
-import os
-import re
 import sys
 import yaml
 from pathlib import Path
 
+from codes import normalize_code
+from fileio import atomic_write_text, file_lock
+
 # === 按你的项目路径设置 ===
 BASE = Path("/home/cwj/code/finace_stock")
 USERS_YAML = BASE / "users.yaml"
@@ -59,10 +60,8 @@ def load_users() -> dict:
 
 
 def dump_users(data: dict) -> None:
-    """写回 users.yaml（保持中文/顺序/缩进友好）"""
-    USERS_YAML.parent.mkdir(parents=True, exist_ok=True)
-    with open(USERS_YAML, "w", encoding="utf-8") as f:
-        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False, indent=2)
+    """写回 users.yaml（保持中文/顺序/缩进友好；原子替换，读的一方不会看到写了一半的文件）"""
+    atomic_write_text(USERS_YAML, yaml.safe_dump(data, allow_unicode=True, sort_keys=False, indent=2))
 
 
 def load_env() -> dict:
@@ -84,49 +83,26 @@ def append_env_if_absent(pairs: list[tuple[str, str]]) -> bool:
     pairs: [(KEY, PLACEHOLDER), ...]
     返回：是否有改动
     """
-    existing = load_env()
-    lines = []
-    if ENV_FILE.exists():
-        lines = ENV_FILE.read_text(encoding="utf-8").splitlines()
-    changed = False
-    for k, v in pairs:
-        if k not in existing:
-            lines.append("")
-            lines.append(f"# {k} for new user (fill the real value):")
-            lines.append(f"{k}={v}")
-            changed = True
-    if changed:
-        ENV_FILE.write_text("\n".join(lines).rstrip() + "\n", encoding="utf-8")
-        try:
-            os.chmod(ENV_FILE, 0o600)
-        except Exception:
-            pass
+    with file_lock(ENV_FILE):
+        existing = load_env()
+        lines = []
+        if ENV_FILE.exists():
+            lines = ENV_FILE.read_text(encoding="utf-8").splitlines()
+        changed = False
+        for k, v in pairs:
+            if k not in existing:
+                lines.append("")
+                lines.append(f"# {k} for new user (fill the real value):")
+                lines.append(f"{k}={v}")
+                changed = True
+        if changed:
+            atomic_write_text(ENV_FILE, "\n".join(lines).rstrip() + "\n", mode=0o600)
     return changed
 
 
 # ---------------- 代码规范化 ----------------
-def normalize_to_prefixed(code_like: str) -> str:
-    """
-    将任意形态的 A 股代码规范为带前缀格式：
-      - 'sh600519' / 'SZ000858' / '600519' / '000858' -> 'sh600519' / 'sz000858'
-    规则：
-      - 如果已有 sh/sz 前缀，按前缀返回（统一小写）。
-      - 否则根据常见号段判定：600/601/603/605/688/689/900 -> 'sh'；其余 -> 'sz'
-    """
-    if not code_like:
-        return ""
-    s = str(code_like).strip().lower()
-    m = re.search(r"(\d{6})", s)
-    if not m:
-        return ""
-    x = m.group(1)
-    if s.startswith("sh"):
-        return "sh" + x
-    if s.startswith("sz"):
-        return "sz" + x
-    if x.startswith(("600", "601", "603", "605", "688", "689", "900")):
-        return "sh" + x
-    return "sz" + x
+# 规则见 codes.py（与 finance_morning / web 共用）
+normalize_to_prefixed = normalize_code
 
 
 # ---------------- 参数解析 ----------------
@@ -223,18 +199,19 @@ def main():
     if args.rss_feeds is not None:
         user_entry["rss_feeds"] = args.rss_feeds
 
-    # 读取/更新 users.yaml
-    data = load_users()
-    users = data["users"]
-    for i, u in enumerate(users):
-        if str(u.get("id", "")) == uid:
-            # 更新已有用户（浅合并）
-            users[i].update(user_entry)
-            break
-    else:
-        # 追加新用户
-        users.append(user_entry)
-    dump_users(data)
+    # 读取/更新 users.yaml（与 web 端导出共用文件锁，读-改-写期间不会被覆盖）
+    with file_lock(USERS_YAML):
+        data = load_users()
+        users = data["users"]
+        for i, u in enumerate(users):
+            if str(u.get("id", "")) == uid:
+                # 更新已有用户（浅合并）
+                users[i].update(user_entry)
+                break
+        else:
+            # 追加新用户
+            users.append(user_entry)
+        dump_users(data)
 
     # 追加 .env 占位（若不存在）
     changed_env = append_env_if_absent(env_pairs)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/import_time.py — 启动耗时基准（基于 python -X importtime）
+- 在干净子进程里 import 指定模块，汇总累计耗时与最慢的依赖
+- 检查重依赖（akshare/pandas/feedparser/requests）没有在 import 阶段被拉进来
+用法：python bench/import_time.py [--budget-ms 300] [finance_morning main web.app]
+超出预算或出现重依赖时退出码为 1，可直接放进 CI / 定时任务前的自检
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY = ("akshare", "pandas", "numpy", "feedparser", "requests", "lxml")
+
+# 默认预算（毫秒）；web.app 的大头是 fastapi/sqlmodel 本身
+BUDGETS = {"finance_morning": 200, "main": 300, "web.app": 2000}
+
+def measure(module: str):
+    """
+    返回 (该模块累计微秒, {直接依赖: 累计微秒}, 导入过的全部顶层包)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} 失败：\n{proc.stderr[-2000:]}")
+    total, deps, pending, seen = 0, {}, {}, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, raw = line[len("import time:"):].split("|")
+        name = raw.strip()
+        depth = (len(raw) - len(raw.lstrip()) - 1) // 2   # importtime 每层缩进 2 格
+        seen.add(name.split(".")[0])
+        if depth == 1:
+            pending[name] = int(cum_us)
+        elif depth == 0:
+            if name == module:
+                total, deps = int(cum_us), dict(pending)
+            pending = {}
+    return total, deps, seen
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="import 耗时基准")
+    ap.add_argument("modules", nargs="*", default=["finance_morning", "main", "web.app"])
+    ap.add_argument("--budget-ms", type=float, help="统一的 import 耗时上限（默认按模块见 BUDGETS）")
+    ap.add_argument("--top", type=int, default=5, help="展示最慢的前 N 个依赖")
+    args = ap.parse_args()
+
+    failed = False
+    for mod in args.modules:
+        total, packages, seen = measure(mod)
+        heavy = sorted(p for p in seen if p in HEAVY)
+        print(f"{mod:<16} {total/1000:8.1f} ms")
+        for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"    {name:<20} {us/1000:8.1f} ms")
+        if heavy:
+            print(f"    !! import 阶段加载了重依赖：{', '.join(heavy)}")
+            failed = True
+        budget = args.budget_ms or BUDGETS.get(mod, 300.0)
+        if total / 1000 > budget:
+            print(f"    !! 超出预算 {budget:.0f} ms")
+            failed = True
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/normalize_bench.py — 代码规范化微基准（不联网）
+对比：全市场规模的 Series 上逐行 .apply(normalize_code) vs 向量化 normalize_series
+用法：python bench/normalize_bench.py [--rows 5500] [--repeat 5]
+"""
+
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+
+from codes import normalize_code, normalize_series
+
+def make_codes(rows: int) -> pd.Series:
+    rnd = random.Random(42)
+    heads = ["sh600", "sh601", "sh603", "sh688", "sz000", "sz002", "sz300", "bj830"]
+    return pd.Series([f"{rnd.choice(heads)}{rnd.randrange(1000):03d}" for _ in range(rows)])
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="代码规范化微基准")
+    ap.add_argument("--rows", type=int, default=5500, help="行数（约等于全市场 A 股数）")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    codes = make_codes(args.rows)
+    raw = normalize_code.__wrapped__   # 不带缓存，等价于原先逐行 apply 的函数
+
+    assert normalize_series(codes).tolist() == codes.apply(raw).tolist()
+
+    t_apply = min(timeit.repeat(lambda: codes.apply(raw), number=1, repeat=args.repeat))
+    t_vec   = min(timeit.repeat(lambda: normalize_series(codes), number=1, repeat=args.repeat))
+    print(f"rows={args.rows}")
+    print(f".apply(normalize_code) : {t_apply*1000:8.2f} ms")
+    print(f"normalize_series       : {t_vec*1000:8.2f} ms")
+    print(f"speedup                : {t_apply/t_vec:8.1f}x")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/query_count.py — web 端每次请求的 SQL 查询数（不联网，数据都在临时库里）
+在临时 SQLite 里造 N 个用户（各带若干自选股/RSS），用 before_cursor_execute 计数：
+  export_users_yaml（全量导出）、export_user（增量导出）、GET /dashboard
+查询数应与用户数无关（selectinload 的 IN 每 500 个 id 分一批，故每 500 用户 +2）；另列出逐用户查询（旧写法）的数字作对照
+用法：python bench/query_count.py [--users 10 100 1000] [--items 5]
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, create_engine, select
+
+import web.app as webapp
+from web.models import User, Watch, Rss
+from web.sessions import SqliteSessions
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.n = 0
+        event.listen(engine, "before_cursor_execute", self._hit)
+
+    def _hit(self, *args):
+        self.n += 1
+
+    def count(self, fn) -> int:
+        start = self.n
+        fn()
+        return self.n - start
+
+def populate(engine, users: int, items: int):
+    with Session(engine) as s:
+        for i in range(users):
+            u = User(uid=f"u{i}", name=f"user{i}", password_hash="x")
+            s.add(u); s.flush()
+            for j in range(items):
+                s.add(Watch(user_id=u.id, code=f"sh{600000 + j:06d}"))
+                s.add(Rss(user_id=u.id, url=f"https://example.com/{i}/{j}.xml"))
+        s.commit()
+
+def naive_export(engine):
+    # 旧写法：每个用户再各查一次 Watch、Rss
+    with Session(engine) as s:
+        for u in s.exec(select(User)).all():
+            s.exec(select(Watch).where(Watch.user_id == u.id)).all()
+            s.exec(select(Rss).where(Rss.user_id == u.id)).all()
+
+def run(users: int, items: int, tmp: Path) -> dict:
+    engine = create_engine(f"sqlite:///{tmp / f'bench_{users}.db'}")
+    SQLModel.metadata.create_all(engine)
+    populate(engine, users, items)
+    webapp.engine = engine
+    webapp.USERS_YAML = tmp / f"users_{users}.yaml"
+    webapp.EXPORT_YAML = True
+    webapp.SESSIONS = SqliteSessions(engine)
+    webapp._EXPORT.update(stamp=None, entries={})
+    qc = QueryCounter(engine)
+
+    from fastapi.testclient import TestClient
+    client = TestClient(webapp.app)
+    client.post("/register", data={"uid": "bench", "name": "bench", "password": "pw"},
+                follow_redirects=False)
+
+    return {
+        "naive": qc.count(lambda: naive_export(engine)),
+        "export_all": qc.count(webapp.export_users_yaml),
+        "export_user": qc.count(lambda: webapp.export_user(f"u{users // 2}")),
+        "dashboard": qc.count(lambda: client.get("/dashboard")),
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="web 端 SQL 查询数基准")
+    ap.add_argument("--users", type=int, nargs="*", default=[10, 100, 1000])
+    ap.add_argument("--items", type=int, default=5, help="每个用户的自选股/RSS 条数")
+    args = ap.parse_args()
+
+    cols = ["naive", "export_all", "export_user", "dashboard"]
+    print(f"{'users':>6} " + " ".join(f"{c:>12}" for c in cols))
+    with tempfile.TemporaryDirectory() as d:
+        for n in args.users:
+            r = run(n, args.items, Path(d))
+            print(f"{n:>6} " + " ".join(f"{r[c]:>12}" for c in cols))
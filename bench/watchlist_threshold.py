@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/watchlist_threshold.py — 自选股抓取策略的阈值基准（需要联网）
+对比：抓全市场 ak.stock_zh_a_spot() 一次 vs 新浪批量定向抓 N 只
+输出各 N 的耗时和建议的 watchlist_sina_max（定向抓仍快于全市场的最大 N）
+用法：python bench/watchlist_threshold.py [--sizes 50 200 800 1600 3200] [--repeat 3]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from finance_morning import _fetch_spot_table, build_spot_index, fetch_quotes_sina
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="新浪定向 vs 全市场 阈值基准")
+    ap.add_argument("--sizes", type=int, nargs="*", default=[50, 200, 800, 1600, 3200])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    df = _fetch_spot_table()
+    t_full = time.perf_counter() - t0
+    universe = sorted(build_spot_index(df))
+    print(f"全市场 stock_zh_a_spot : {t_full:8.2f} s  ({len(universe)} 只)")
+
+    best = 0
+    for n in args.sizes:
+        codes = universe[:n]
+        t = timed(lambda: fetch_quotes_sina(codes), args.repeat)
+        print(f"新浪批量 N={n:<6}       : {t:8.2f} s")
+        if t < t_full:
+            best = max(best, n)
+    print(f"\n建议 watchlist_sina_max: {best}")
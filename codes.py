@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+codes.py — A 股代码规范化（全项目共用）
+- normalize_code：单个代码（表单/命令行输入），带缓存
+- normalize_series：整列代码（全市场快照），pandas/NumPy 向量化
+规则：已有 sh/sz 前缀按前缀；否则按号段 600/601/603/605/688/689/900 -> sh，其余 -> sz
+"""
+
+import re
+from functools import lru_cache
+
+SH_HEADS = ("600", "601", "603", "605", "688", "689", "900")
+
+_CODE6 = re.compile(r"(\d{6})")
+
+@lru_cache(maxsize=4096)
+def normalize_code(code_like) -> str:
+    """
+    任意形态 -> 带前缀：sh600519 / sz000858；无法识别返回 ""
+    """
+    if not code_like:
+        return ""
+    s = str(code_like).strip().lower()
+    m = _CODE6.search(s)
+    if not m:
+        return ""
+    x = m.group(1)
+    if s.startswith("sh"):
+        return "sh" + x
+    if s.startswith("sz"):
+        return "sz" + x
+    if x.startswith(SH_HEADS):
+        return "sh" + x
+    return "sz" + x
+
+def normalize_series(series):
+    """
+    pandas.Series 版本，结果与逐行 normalize_code 一致（无法识别为 ""）
+    快路径：把 "600519" / "sh600519" 这类定长代码转成 uint32 码点矩阵，
+    前缀按 np.where(前3位 in SH_HEADS) 判定；其它形态逐个回退到 normalize_code
+    """
+    import numpy as np
+    import pandas as pd
+
+    raw = series.to_numpy(dtype=object)
+    n = len(raw)
+    if n == 0:
+        return pd.Series([], index=series.index, dtype=object)
+    # 多留 1 位：第 9 位非空说明原串超过 8 位，走回退
+    m = np.asarray(raw.astype(str), dtype="U9").view(np.uint32).reshape(n, 9)
+    isd = (m >= 48) & (m <= 57)
+    fits = m[:, 8] == 0
+    six = fits & isd[:, :6].all(1) & (m[:, 6] == 0)
+    eight = fits & ~isd[:, 1] & isd[:, 2:8].all(1)
+
+    digits = np.where(six[:, None], m[:, :6], m[:, 2:8])
+    head3 = (digits[:, 0] - 48) * 100 + (digits[:, 1] - 48) * 10 + (digits[:, 2] - 48)
+    p0, p1 = m[:, 0] | 0x20, m[:, 1] | 0x20          # 大小写不敏感
+    has_sh = eight & (p0 == ord("s")) & (p1 == ord("h"))
+    has_sz = eight & (p0 == ord("s")) & (p1 == ord("z"))
+    is_sh = has_sh | (~has_sz & np.isin(head3, [int(h) for h in SH_HEADS]))
+
+    out = np.empty((n, 8), dtype=np.uint32)
+    out[:, 0] = ord("s")
+    out[:, 1] = np.where(is_sh, ord("h"), ord("z"))
+    out[:, 2:] = digits
+    res = out.view("U8").ravel().astype(object)
+
+    slow = ~(six | eight)
+    if slow.any():
+        res[slow] = [normalize_code(x) for x in raw[slow]]
+    return pd.Series(res, index=series.index, dtype=object)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+feeds.py — RSS 抓取层
+- 多个 feed 用有界线程池并发抓取，单个 feed 超时不拖累整份报告
+- 输出顺序与 feeds 列表一致，每个 feed 截取前 limit_per_feed 条
+- 按 URL 缓存解析结果（TTL 内复用），同进程内所有用户 / web 预览共享
+- 正文用 net.get 下载（有 socket 超时，走共享连接池，只试一次），feedparser 只负责解析
+- 过期后用 ETag / Last-Modified 做条件 GET，状态落盘，304 直接复用旧条目
+- 每个 RSS 主机一个熔断器，主机挂掉时直接跳过（有旧条目则用旧的）
+"""
+
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import net
+from fileio import atomic_write_text
+from health import breaker
+
+DEFAULT_TTL = 600.0
+DEFAULT_TIMEOUT = 10.0
+NO_RETRY = net.RetryPolicy(attempts=1)
+QUEUE_POLL = 0.05    # 排队中的 feed 多久看一次是否已开始抓
+
+# url -> {"fetched": 时间戳, "entries": [...], "etag": ..., "modified": ...}
+_CACHE: Dict[str, dict] = {}
+_URL_LOCKS: Dict[str, threading.Lock] = {}
+_GUARD = threading.Lock()
+_LOADED: set = set()     # 已读入 _CACHE 的状态文件
+
+def _url_lock(url: str) -> threading.Lock:
+    with _GUARD:
+        return _URL_LOCKS.setdefault(url, threading.Lock())
+
+# ---------- 磁盘状态（ETag / Last-Modified + 已解析条目） ----------
+def _load_state(path: Optional[Path]) -> None:
+    if path is None:
+        return
+    with _GUARD:
+        if str(path) in _LOADED:
+            return
+        _LOADED.add(str(path))
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except Exception:
+            return
+        for url, rec in (data or {}).items():
+            if url not in _CACHE and isinstance(rec, dict):
+                _CACHE[url] = rec
+
+def _save_state(path: Optional[Path]) -> None:
+    if path is None:
+        return
+    path = Path(path)
+    with _GUARD:
+        data = json.dumps(_CACHE, ensure_ascii=False)
+    try:
+        atomic_write_text(path, data)
+    except Exception:
+        pass
+
+# ---------- 抓取 + 缓存 ----------
+def _entry(e, url: str) -> dict:
+    title = getattr(e, "title", "(no title)")
+    link  = getattr(e, "link",  "")
+    pub   = getattr(e, "published", getattr(e, "updated", ""))
+    return {"source": url, "title": title.strip(), "link": link, "time": pub}
+
+def parse_feed(url: str, etag: str = None, modified: str = None,
+               timeout: float = DEFAULT_TIMEOUT) -> Tuple[Optional[List[dict]], dict]:
+    """
+    条件 GET：带上次的 etag / modified；正文由 net.get 下载（timeout 是 socket 超时），
+    不让 feedparser 自己联网——它不设超时，卡住的线程会拖住进程退出；
+    也不重试：fetch_feeds 放弃后线程还在重试同样会拖住退出，失败的 feed 沿用旧条目、下次再抓
+    返回 (条目, 新的校验头)，304 未修改时条目为 None；其它非 2xx 抛 HTTPError
+    """
+    import feedparser
+    headers = {"User-Agent": feedparser.USER_AGENT}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    resp = net.get(url, timeout=timeout, headers=headers, policy=NO_RETRY)
+    validators = {"etag": resp.headers.get("ETag") or etag,
+                  "modified": resp.headers.get("Last-Modified") or modified}
+    if resp.status_code == 304:
+        return None, validators
+    resp.raise_for_status()
+    # feedparser 按小写头名取 content-type（判断编码）/ content-location（相对链接）
+    resp_headers = {k.lower(): v for k, v in resp.headers.items()}
+    resp_headers.setdefault("content-location", resp.url)
+    d = feedparser.parse(resp.content, response_headers=resp_headers)
+    return [_entry(e, url) for e in d.entries], validators
+
+def get_entries(url: str, ttl: float = DEFAULT_TTL, state_path: Optional[Path] = None,
+                timeout: float = DEFAULT_TIMEOUT) -> List[dict]:
+    """
+    TTL 内直接用缓存；过期后带 ETag/Last-Modified 重新请求，304 则沿用旧条目
+    同一 URL 并发请求只会真正抓一次；空结果（多半是网络错误）不入缓存，下次重试
+    抓取失败 / 主机熔断中则沿用旧条目（没有就返回空）
+    state_path: 校验头与条目的落盘位置，跨进程/跨次运行复用；None 则只在内存
+    """
+    _load_state(state_path)
+    hit = _CACHE.get(url)
+    if hit and time.time() - hit.get("fetched", 0) < ttl:
+        return hit["entries"]
+    with _url_lock(url):
+        hit = _CACHE.get(url) or {}
+        if hit and time.time() - hit.get("fetched", 0) < ttl:
+            return hit["entries"]
+        try:
+            items, validators = breaker("rss:" + urlsplit(url).netloc).call(
+                lambda: parse_feed(url, hit.get("etag"), hit.get("modified"), timeout),
+                valid=lambda r: r[0] is None or len(r[0]) > 0,
+            )
+        except Exception:       # 含 CircuitOpen
+            return hit.get("entries") or []
+        if items is None:
+            items = hit.get("entries") or []
+        if not items:
+            return items
+        _CACHE[url] = {"fetched": time.time(), "entries": items, **validators}
+    _save_state(state_path)
+    return items
+
+def clear_cache() -> None:
+    with _GUARD:
+        _CACHE.clear()
+        _LOADED.clear()
+
+def fetch_feeds(feeds: List[str], limit_per_feed: int = 6, workers: int = 4, timeout: float = DEFAULT_TIMEOUT,
+                ttl: float = DEFAULT_TTL, state_path: Optional[Path] = None) -> List[dict]:
+    """
+    并发抓取；超时/出错的 feed 直接跳过（与原先串行版一致）
+    timeout 从该 feed 真正开始抓取时计时；排队中的 feed 另受总时限约束；
+    同时作为下载的 socket 超时，被放弃的线程也会很快结束，不会拖住进程退出
+    ttl: 缓存有效期（秒），0 表示每次都发条件 GET
+    state_path: ETag/Last-Modified 状态文件（见 get_entries）
+    """
+    urls = [u for u in feeds or [] if u]
+    if not urls:
+        return []
+    workers = max(1, min(int(workers), len(urls)))
+    started = {}
+
+    def run(i: int, url: str) -> List[dict]:
+        started[i] = time.monotonic()
+        return get_entries(url, ttl, state_path, timeout)[:limit_per_feed]
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rss")
+    futures = [pool.submit(run, i, u) for i, u in enumerate(urls)]
+    hard_deadline = time.monotonic() + timeout * math.ceil(len(urls) / workers)
+    results: List[List[dict]] = [[] for _ in urls]
+    try:
+        for i, fut in enumerate(futures):
+            while True:
+                t0 = started.get(i)
+                until = hard_deadline if t0 is None else min(t0 + timeout, hard_deadline)
+                left = max(until - time.monotonic(), 0)
+                try:
+                    # 还在排队时短轮询，一开始抓就改按它自己的起点计时
+                    results[i] = fut.result(timeout=left if t0 is not None else min(left, QUEUE_POLL))
+                    break
+                except TimeoutError:
+                    if left <= 0:
+                        break
+                except Exception:
+                    break
+    finally:
+        # 不等卡住的线程；尚未开始的直接取消
+        pool.shutdown(wait=False, cancel_futures=True)
+    return [it for chunk in results for it in chunk]
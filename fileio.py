@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+fileio.py — 文本文件的原子写入与跨进程锁
+（users.yaml / .env / RSS 状态 / 数据源健康度 / 预览输出共用；文件锁用于 web 端与 add_user.py）
+- atomic_write_text：写同目录临时文件 → fsync → os.replace；读的一方只会看到完整的旧文件或新文件
+- file_lock：对 <文件>.lock 加 fcntl.flock 排它锁，多个 uvicorn worker / 脚本的“读-改-写”依次进行；
+  只锁这一个文件，不影响其它请求
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:     # Windows 没有 flock，只剩进程内互斥
+    fcntl = None
+
+_LOCKS: dict = {}
+_LOCKS_GUARD = threading.Lock()
+
+def _thread_lock(path: Path) -> threading.Lock:
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(str(path), threading.Lock())
+
+@contextmanager
+def file_lock(path):
+    """
+    path 的排它锁（锁文件为同目录的 <name>.lock，不会被 os.replace 换掉）；
+    同进程的线程先过线程锁，再由 flock 与其它进程互斥
+    """
+    path = Path(path)
+    lock_path = path.with_name(path.name + ".lock")
+    with _thread_lock(lock_path):
+        if fcntl is None:
+            yield
+            return
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def atomic_write_text(path, text: str, mode: int = None, encoding: str = "utf-8"):
+    """
+    原子替换 path 的内容。mode 为空时沿用原文件权限；
+    临时文件一创建就是该权限，密钥不会有一刻对其他用户可读
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if mode is None:
+        try:
+            mode = path.stat().st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with os.fdopen(fd, "w", encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)     # os.open 的权限会被 umask 削掉
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+    # 目录项也落盘，断电后不会回到旧文件
+    try:
+        dfd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    except OSError:
+        pass
@@ -2,10 +2,11 @@
 # -*- coding: utf-8 -*-
 """
 finance_morning.py — 数据抓取 + 渲染模块（含“测试/预览”，绝不发送）
-- 读取 config.yaml / users.yaml
+- 读取 config.yaml；用户名单来自 web 端 SQLite（web/app.db）或 users.yaml
 - 抓取：大盘（AkShare + 新浪兜底）、北向、自选股、RSS
 - 渲染：输出 Markdown
 - CLI（仅测试）：打印并保存到 out/，不发送
+- akshare / pandas / feedparser / requests 都在用到时才导入，import 本模块很轻
 """
 
 import argparse
@@ -13,27 +14,30 @@ import io
 import math
 import os
 import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple
 
-import akshare as ak
-import feedparser
-import pytz
-import requests
 import yaml
 
+import net
+from codes import normalize_code, normalize_series
+from feeds import fetch_feeds
+from fileio import atomic_write_text
+from health import SourceHealth, configure_breakers, guarded
+from snapshots import SnapshotStore
+
 # 路径按你的项目
 BASE_DIR = Path("/home/cwj/code/finace_stock").resolve()
 CONFIG_PATH = BASE_DIR / "config.yaml"
 USERS_PATH  = BASE_DIR / "users.yaml"
-
-out_dir = 'out'
-if os.path.exists(out_dir):
-    for filename in os.listdir(out_dir):
-        file_path = os.path.join(out_dir, filename)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+USERS_DB    = BASE_DIR / "web" / "app.db"       # web 端的用户库
+CACHE_DIR   = BASE_DIR / "cache"
+RSS_STATE_PATH = CACHE_DIR / "rss_state.json"   # RSS 的 ETag/Last-Modified 与条目
+SNAPSHOT_DIR   = CACHE_DIR / "snapshots"        # 行情快照（Parquet）
+HEALTH_PATH    = CACHE_DIR / "source_health.json"  # 数据源延迟/失败统计
 
 # ---------- 基础加载 ----------
 def load_yaml(path: Path) -> dict:
@@ -42,6 +46,51 @@ def load_yaml(path: Path) -> dict:
             return yaml.safe_load(f) or {}
     return {}
 
+# ---------- 用户名单 ----------
+# users_source（config.yaml 或 --source）：
+#   db   只读 web/app.db
+#   yaml 只读 users.yaml（旧方式，add_user.py 写的）
+#   auto 以 app.db 为准，再补上 users.yaml 里库中没有的 id；没有 app.db 时只读 users.yaml
+USERS_SOURCES = ("auto", "db", "yaml")
+
+def load_users_db(path: Path = None) -> List[dict]:
+    """
+    直接从 SQLite 读用户名单，条目格式同 users.yaml（固定 3 条查询）；
+    sqlmodel / web.models 用到时才导入
+    """
+    path = Path(path or USERS_DB)
+    if not path.exists():
+        return []
+    from sqlalchemy.orm import selectinload
+    from sqlmodel import Session, create_engine, select
+    from web.models import User
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        with Session(engine) as s:
+            stmt = (select(User).options(selectinload(User.watchlist), selectinload(User.rss))
+                    .order_by(User.id))
+            return [u.to_entry() for u in s.exec(stmt).all()]
+    finally:
+        engine.dispose()
+
+def users_source(defaults: dict, source: str = None) -> str:
+    source = (source or defaults.get("users_source") or "auto").lower()
+    if source not in USERS_SOURCES:
+        raise ValueError(f"users_source 只能是 {'/'.join(USERS_SOURCES)}：{source}")
+    return source
+
+def load_users(defaults: dict, source: str = None) -> List[dict]:
+    """
+    按 users_source 读用户名单；source 为空时用 config.yaml 的 users_source（默认 auto）
+    """
+    source = users_source(defaults, source)
+    users = load_users_db() if source in ("auto", "db") else []
+    if source == "yaml" or (source == "auto" and USERS_PATH.exists()):
+        seen = {str(u["id"]) for u in users}
+        users += [u for u in load_yaml(USERS_PATH).get("users") or []
+                  if str(u.get("id", "")) not in seen]
+    return users
+
 def pct(x) -> str:
     try:
         return f"{x:.2f}%"
@@ -52,24 +101,8 @@ def now_str(tzname: str) -> str:
     import pytz
     return datetime.now(pytz.timezone(tzname)).strftime("%Y-%m-%d %H:%M")
 
-def normalize_to_prefixed(code_like: str) -> str:
-    """
-    任意形态 -> 带前缀：sh600519 / sz000858
-    """
-    if not code_like:
-        return ""
-    s = str(code_like).strip().lower()
-    m = re.search(r"(\d{6})", s)
-    if not m:
-        return ""
-    x = m.group(1)
-    if s.startswith("sh"):
-        return "sh" + x
-    if s.startswith("sz"):
-        return "sz" + x
-    if x.startswith(("600","601","603","605","688","689","900")):
-        return "sh" + x
-    return "sz" + x
+# 代码规范化统一在 codes.py，这里保留旧名供调用方使用
+normalize_to_prefixed = normalize_code
 
 def pick_user_value(user: dict, defaults: dict, key: str, fallback=None):
     """
@@ -81,8 +114,14 @@ def pick_user_value(user: dict, defaults: dict, key: str, fallback=None):
         return defaults[key]
     return fallback
 
+def _nonempty(out) -> bool:
+    return out is not None and len(out) > 0
+
 # ---------- 大盘（AkShare + 新浪兜底） ----------
+# 各上游都套熔断器（health.guarded）：连续失败后直接抛 CircuitOpen，走原有兜底
+@guarded("akshare_index", _nonempty)
 def _fetch_index_snapshot_ak() -> List[dict]:
+    import akshare as ak
     df = ak.stock_zh_index_spot()
     if df is None or df.empty or ("代码" not in df.columns):
         return []
@@ -103,6 +142,7 @@ def _fetch_index_snapshot_ak() -> List[dict]:
         out.append({"name": name, "price": price, "change_pct": chg})
     return out
 
+@guarded("sina", _nonempty)
 def _fetch_index_snapshot_sina() -> List[dict]:
     items = [
         ("上证指数", "s_sh000001"),
@@ -111,7 +151,7 @@ def _fetch_index_snapshot_sina() -> List[dict]:
     ]
     url = "https://hq.sinajs.cn/?list=" + ",".join(code for _, code in items)
     headers = {"Referer": "https://finance.sina.com.cn", "User-Agent": "Mozilla/5.0"}
-    resp = requests.get(url, headers=headers, timeout=8)
+    resp = net.get(url, headers=headers, timeout=8)
     text = resp.content.decode("gbk", errors="ignore")
     out = []
     for (expected, _), line in zip(items, text.strip().splitlines()):
@@ -127,26 +167,113 @@ def _fetch_index_snapshot_sina() -> List[dict]:
             continue
     return out
 
-def fetch_index_snapshot() -> List[dict]:
-    try:
-        out = _fetch_index_snapshot_ak()
-        if len(out) == 3 and all(isinstance(x.get("price"), (int,float)) and not math.isnan(x["price"]) for x in out):
-            return out
-    except Exception:
-        pass
+# ---------- 个股（新浪批量行情，小自选股用） ----------
+SINA_BATCH = 800          # 每个请求的代码数，保证 URL 不超长
+WATCHLIST_SINA_MAX = 1000 # 自选股并集不超过该数量时走新浪批量，否则抓全市场（见 bench/watchlist_threshold.py）
+
+@guarded("sina")
+def fetch_quotes_sina(codes: List[str], batch: int = SINA_BATCH) -> Dict[str, dict]:
+    """
+    新浪 hq.sinajs.cn 批量简版行情（s_ 前缀）：{带前缀代码: 行情}
+    与 build_spot_index 的结构一致；查不到的代码不出现在结果里
+    """
+    want = sorted({normalize_to_prefixed(c) for c in codes if c} - {""})
+    headers = {"Referer": "https://finance.sina.com.cn", "User-Agent": "Mozilla/5.0"}
+    out = {}
+    for i in range(0, len(want), batch):
+        chunk = want[i:i + batch]
+        url = "https://hq.sinajs.cn/?list=" + ",".join("s_" + c for c in chunk)
+        resp = net.get(url, headers=headers, timeout=8)
+        text = resp.content.decode("gbk", errors="ignore")
+        for m in re.finditer(r'hq_str_s_(\w+)="([^"]*)"', text):
+            code, parts = m.group(1), m.group(2).split(",")
+            if len(parts) < 4 or not parts[0]:
+                continue
+            out[code] = {
+                "code": code,
+                "name": parts[0],
+                "price": _to_float(parts[1]),
+                "change_pct": _to_float(parts[3], 0.0),
+            }
+    return out
+
+def _index_valid(out: List[dict]) -> bool:
+    return len(out) == 3 and all(isinstance(x.get("price"), (int,float)) and not math.isnan(x["price"]) for x in out)
+
+INDEX_SOURCES = {
+    "akshare": (_fetch_index_snapshot_ak, _index_valid),
+    "sina":    (_fetch_index_snapshot_sina, bool),
+}
+
+def fetch_index_snapshot(hedge_delay: float = None, health: SourceHealth = None) -> List[dict]:
+    """
+    默认 AkShare 优先，新浪兜底
+    hedge_delay: 对冲模式——首选源超过该秒数还没返回就同时发备选源，谁先给出有效结果用谁；
+    None 表示按顺序：首选失败后再试备选
+    health: 数据源健康度（见 health.py），给定则按历史表现排序，冷却中的源放到最后
+    """
+    names = list(INDEX_SOURCES)
+    if health is not None:
+        names = health.order(names)
+
+    def run(name: str):
+        fn, valid = INDEX_SOURCES[name]
+        return health.call(name, fn, valid) if health is not None else fn()
+
+    if hedge_delay is not None:
+        return _fetch_index_snapshot_hedged(names, run, hedge_delay)
+    for name in names:
+        try:
+            out = run(name)
+            if INDEX_SOURCES[name][1](out):
+                return out
+        except Exception:
+            continue
+    return index_placeholder()
+
+def _fetch_index_snapshot_hedged(names: List[str], run, hedge_delay: float) -> List[dict]:
+    primary, backup = names[0], names[1]
+    valid = {n: INDEX_SOURCES[n][1] for n in names}
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="index")
     try:
-        return _fetch_index_snapshot_sina()
-    except Exception:
-        return [
-            {"name":"上证指数","price":math.nan,"change_pct":math.nan},
-            {"name":"深证成指","price":math.nan,"change_pct":math.nan},
-            {"name":"创业板指","price":math.nan,"change_pct":math.nan},
-        ]
+        first = pool.submit(run, primary)
+        wait([first], timeout=max(hedge_delay, 0))
+        if first.done() and not first.exception() and valid[primary](first.result()):
+            return first.result()
+        futures = {first: primary, pool.submit(run, backup): backup}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if not fut.exception() and valid[futures[fut]](fut.result()):
+                    return fut.result()
+        return index_placeholder()
+    finally:
+        # 输掉的那一路不等它（它结束时仍会记入 health）
+        pool.shutdown(wait=False)
+
+def index_placeholder() -> List[dict]:
+    return [
+        {"name":"上证指数","price":math.nan,"change_pct":math.nan},
+        {"name":"深证成指","price":math.nan,"change_pct":math.nan},
+        {"name":"创业板指","price":math.nan,"change_pct":math.nan},
+    ]
 
 # ---------- 其它数据 ----------
-def fetch_north_money() -> dict:
+@guarded("akshare_hsgt", _nonempty)
+def _fetch_north_table():
+    import akshare as ak
+    df = ak.stock_hsgt_north_net_flow_in()
+    if df is None or df.empty:
+        return None
+    return df
+
+def fetch_north_money(store: SnapshotStore = None) -> dict:
+    """
+    store: 快照库，给定则先读本地 Parquet（见 snapshots.py）
+    """
     try:
-        df = ak.stock_hsgt_north_net_flow_in()
+        df = store.read_through("hsgt_north", _fetch_north_table) if store else _fetch_north_table()
         if df is not None and not df.empty:
             last = df.iloc[-1]
             date = str(last.get("日期") or last.get("date") or "")
@@ -158,51 +285,283 @@ def fetch_north_money() -> dict:
         pass
     return {"date": "", "north_net_in": None}
 
-def fetch_watchlist(codes: List[str]) -> List[dict]:
+@guarded("akshare_spot", _nonempty)
+def _fetch_spot_table():
+    import akshare as ak
+    df = ak.stock_zh_a_spot()
+    if df is None or df.empty or ("代码" not in df.columns):
+        return None
+    return df
+
+def fetch_spot_table(store: SnapshotStore = None):
+    """
+    全市场 A 股快照（5000+ 行）；失败返回 None
+    store: 快照库，给定则先读本地 Parquet
+    """
+    try:
+        return store.read_through("a_spot", _fetch_spot_table) if store else _fetch_spot_table()
+    except Exception:
+        return None
+
+def _to_float(x, default=math.nan) -> float:
+    try:
+        return float(str(x).replace("%","") or default)
+    except Exception:
+        return default
+
+def build_spot_index(df) -> Dict[str, dict]:
+    """
+    全市场快照 -> {带前缀代码: 行情}，每次运行只建一次，之后按代码 O(1) 查
+    """
+    if df is None:
+        return {}
+    codes = normalize_series(df["代码"])
+    names = df["名称"] if "名称" in df.columns else [""] * len(df)
+    price = df["最新价"] if "最新价" in df.columns else [math.nan] * len(df)
+    chg   = df["涨跌幅"] if "涨跌幅" in df.columns else [0.0] * len(df)
+    index = {}
+    for code, name, p, c in zip(codes, names, price, chg):
+        if not code:
+            continue
+        index[code] = {
+            "code": code,
+            "name": str(name),
+            "price": _to_float(p),
+            "change_pct": _to_float(c, 0.0),
+        }
+    return index
+
+def build_spot_arrow(df):
+    """
+    全市场快照 -> 按代码排序的精简 pyarrow.Table（code/name/price/change_pct）
+    """
+    index = build_spot_index(df)
+    if not index:
+        return None
+    import pyarrow as pa
+    rows = [index[c] for c in sorted(index)]
+    return pa.table({
+        "code": pa.array([r["code"] for r in rows], pa.string()),
+        "name": pa.array([r["name"] for r in rows], pa.string()),
+        "price": pa.array([r["price"] for r in rows], pa.float64()),
+        "change_pct": pa.array([r["change_pct"] for r in rows], pa.float64()),
+    })
+
+class ArrowSpotIndex:
+    """
+    build_spot_index 的只读替身：数据留在内存映射的 Arrow 文件里，
+    按已排序的 code 列二分查找，不在本进程复制全市场数据
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._codes = table.column("code")
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def _find(self, code: str) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._codes[mid].as_py() < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._codes[lo].as_py() == code else -1
+
+    def __contains__(self, code: str) -> bool:
+        return self._find(code) >= 0
+
+    def __getitem__(self, code: str) -> dict:
+        i = self._find(code)
+        if i < 0:
+            raise KeyError(code)
+        return {k: self.table.column(k)[i].as_py() for k in ("code", "name", "price", "change_pct")}
+
+def fetch_watchlist(codes: List[str], spot_index: Dict[str, dict] = None) -> List[dict]:
+    """
+    spot_index: 预先建好的代码索引（MarketContext.spot_index）；不传则现抓现建
+    """
     try:
         if codes is None:
             return []
         want = {normalize_to_prefixed(c) for c in codes if c}
+        want.discard("")
         if not want:
             return []
-        df = ak.stock_zh_a_spot()
-        if df is None or df.empty or ("代码" not in df.columns):
-            return []
-        df = df.copy()
-        df["code6"]     = df["代码"].astype(str).str.extract(r"(\d{6})")
-        df["code_pref"] = df["code6"].apply(normalize_to_prefixed)
-        df = df[df["code_pref"].isin(want)]
-        res = []
-        for _, r in df.iterrows():
-            try:
-                res.append({
-                    "code":  str(r.get("code_pref","")),
-                    "name":  str(r.get("名称","")),
-                    "price": float(r.get("最新价", math.nan)),
-                    "change_pct": float(str(r.get("涨跌幅","0")).replace("%","") or 0.0),
-                })
-            except Exception:
-                continue
+        if spot_index is None:
+            spot_index = build_spot_index(fetch_spot_table())
+        res = [dict(spot_index[c]) for c in want if c in spot_index]
         return sorted(res, key=lambda x: abs(x.get("change_pct") or 0), reverse=True)
     except Exception:
         return []
 
-def fetch_rss(feeds: List[str], limit_per_feed: int = 6) -> List[dict]:
-    items = []
-    for url in feeds or []:
-        try:
-            d = feedparser.parse(url)
-            cnt = 0
-            for e in d.entries:
-                title = getattr(e, "title", "(no title)")
-                link  = getattr(e, "link",  "")
-                pub   = getattr(e, "published", getattr(e, "updated", ""))
-                items.append({"source": url, "title": title.strip(), "link": link, "time": pub})
-                cnt += 1
-                if cnt >= limit_per_feed: break
-        except Exception:
-            continue
-    return items
+def fetch_rss(feeds: List[str], limit_per_feed: int = 6, workers: int = 4, timeout: float = 10.0,
+              ttl: float = 600.0) -> List[dict]:
+    """
+    并发抓取 + 按 URL 缓存（见 feeds.py）
+    workers / timeout / ttl 对应 config.yaml 的 rss_workers / rss_timeout / rss_cache_ttl
+    """
+    try:
+        return fetch_feeds(feeds, limit_per_feed=limit_per_feed, workers=workers, timeout=timeout, ttl=ttl,
+                           state_path=RSS_STATE_PATH)
+    except Exception:
+        return []
+
+# ---------- 单次运行共享的行情上下文 ----------
+def snapshot_store(defaults: dict):
+    """
+    按 config.yaml 的 snapshot_ttl（秒）建快照库；0 表示关闭
+    """
+    ttl = float(defaults.get("snapshot_ttl", 300))
+    if ttl <= 0:
+        return None
+    return SnapshotStore(SNAPSHOT_DIR, max_age=ttl, keep_days=int(defaults.get("snapshot_keep_days", 7)))
+
+class MarketContext:
+    """
+    一次运行（main.py 全部用户 / 一次预览）共享的行情数据：
+    大盘、北向、全市场快照各只抓一次，按需懒加载，线程安全。
+    store: 可选的 SnapshotStore，北向/全市场表先读本地快照，跨运行复用
+    sina_max: 定向抓取的代码总数上限；超过后改用全市场快照（一次抓全）
+    hedge_delay: 大盘对冲延迟（秒），见 fetch_index_snapshot
+    health: 数据源健康度，决定大盘各源的尝试顺序
+    """
+
+    def __init__(self, store: SnapshotStore = None, sina_max: int = WATCHLIST_SINA_MAX,
+                 hedge_delay: float = None, health: SourceHealth = None):
+        self.store = store
+        self.hedge_delay = hedge_delay
+        self.health = health
+        self.sina_max = int(sina_max)
+        self._quotes: Dict[str, dict] = {}   # 新浪定向抓到的个股行情
+        self._tried: set = set()             # 已向新浪请求过的代码（含查无此股）
+        self._quotes_lock = threading.Lock()
+        self._cache: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._late: Dict[str, object] = {}   # 超过报告时限仍在跑的抓取：key -> Future
+        self._guard = threading.Lock()
+
+    def _get(self, key: str, loader):
+        with self._guard:
+            if key in self._cache:
+                return self._cache[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                self._cache[key] = loader()
+            return self._cache[key]
+
+    def late(self, key: str) -> bool:
+        """
+        key 的某次抓取已经错过报告时限且还没结束：后面的报告直接用兜底，
+        不再排队等同一把锁、每份都白等一个 report_deadline；那次抓取结束后恢复正常
+        """
+        with self._guard:
+            fut = self._late.get(key)
+            if fut is not None and fut.done():
+                del self._late[key]
+                fut = None
+            return fut is not None
+
+    def mark_late(self, key: str, fut) -> None:
+        with self._guard:
+            self._late[key] = fut
+
+    @property
+    def index(self) -> List[dict]:
+        return self._get("index", lambda: fetch_index_snapshot(self.hedge_delay, self.health))
+
+    @property
+    def north(self) -> dict:
+        return self._get("north", lambda: fetch_north_money(self.store))
+
+    @property
+    def spot(self):
+        return self._get("spot", lambda: fetch_spot_table(self.store))
+
+    @property
+    def spot_index(self) -> Dict[str, dict]:
+        """
+        有快照库时用共享的 Arrow 内存映射（多进程共用一份页缓存），否则普通 dict
+        """
+        return self._get("spot_index", self._load_spot_index)
+
+    def _load_spot_index(self):
+        if self.store is not None:
+            try:
+                table = self.store.read_through_arrow("a_spot_index", lambda: build_spot_arrow(self.spot))
+                if table is not None:
+                    return ArrowSpotIndex(table)
+            except Exception:
+                pass
+        return build_spot_index(self.spot)
+
+    def quotes(self, codes: List[str]) -> Dict[str, dict]:
+        """
+        按规模选策略：累计要查的代码不多时用新浪批量定向抓（已抓过的复用），
+        否则（或全市场表已在手）查全市场索引
+        """
+        want = {normalize_to_prefixed(c) for c in codes if c} - {""}
+        if "spot_index" in self._cache:
+            return self.spot_index
+        with self._quotes_lock:
+            missing = want - self._tried
+            if len(self._tried) + len(missing) <= self.sina_max:
+                try:
+                    if missing:
+                        self._quotes.update(fetch_quotes_sina(sorted(missing)))
+                        self._tried |= missing
+                    return {c: self._quotes[c] for c in want if c in self._quotes}
+                except Exception:
+                    pass    # 新浪失败 -> 退回全市场
+        return self.spot_index
+
+    def prefetch(self, codes) -> int:
+        """
+        运行开始前一次性抓好所有用户自选股的并集（分批请求），之后各用户直接查缓存
+        返回并集大小
+        """
+        want = {normalize_to_prefixed(c) for c in codes if c} - {""}
+        if want:
+            self.quotes(sorted(want))
+        return len(want)
+
+    def watchlist(self, codes: List[str]) -> List[dict]:
+        if not codes:
+            return []
+        return fetch_watchlist(codes, spot_index=self.quotes(codes))
+
+def watchlist_union(users: List[dict], defaults: dict) -> set:
+    """
+    所有用户（含继承全局 watchlist 的）规范化后的自选股并集
+    """
+    union = set()
+    for u in users:
+        for c in pick_user_value(u, defaults, "watchlist", []) or []:
+            code = normalize_to_prefixed(c)
+            if code:
+                union.add(code)
+    return union
+
+def source_health(defaults: dict) -> SourceHealth:
+    """
+    config.yaml 的 source_health 段：cooldown / max_failures / slow_after
+    """
+    return SourceHealth(HEALTH_PATH, **(defaults.get("source_health") or {}))
+
+def market_context(defaults: dict) -> MarketContext:
+    """
+    按 config.yaml 建一次运行的 MarketContext（快照库 / watchlist_sina_max / index_hedge_delay / 健康度），
+    并应用 circuit_breaker 配置
+    """
+    configure_breakers(defaults.get("circuit_breaker"))
+    hedge = defaults.get("index_hedge_delay")
+    return MarketContext(snapshot_store(defaults),
+                         sina_max=int(defaults.get("watchlist_sina_max", WATCHLIST_SINA_MAX)),
+                         hedge_delay=None if hedge is None or float(hedge) < 0 else float(hedge),
+                         health=source_health(defaults))
 
 # ---------- 渲染 ----------
 def render_markdown(gen_time: str, idx, north, watchlist, rss_items, username: str="") -> str:
@@ -247,62 +606,138 @@ def render_markdown(gen_time: str, idx, north, watchlist, rss_items, username: s
     return s.getvalue()
 
 # ---------- 生成报告（主暴露函数） ----------
-def generate_report(user: dict, defaults: dict) -> Tuple[str, dict]:
+def gather_with_deadline(tasks: List[Tuple], deadline: float, ctx: MarketContext = None) -> list:
+    """
+    tasks: [(fetch, fallback, key), ...] 并发执行 fetch；deadline 秒内未完成或出错的取 fallback()
+    不等待超时的线程（它们在后台跑完后仍会填进 MarketContext 的缓存）
+    key 非空时：超时记进 ctx，之后的报告在那次抓取结束前直接取 fallback()，不再提交
+    """
+    pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="report")
+    futures = [None if ctx is not None and key and ctx.late(key) else pool.submit(fetch)
+               for fetch, _, key in tasks]
+    wait([f for f in futures if f is not None], timeout=deadline)
+    pool.shutdown(wait=False, cancel_futures=True)
+    out = []
+    for fut, (_, fallback, key) in zip(futures, tasks):
+        if fut is None or not fut.done():
+            if fut is not None and ctx is not None and key:
+                ctx.mark_late(key, fut)
+            out.append(fallback())
+            continue
+        try:
+            out.append(fut.result(timeout=0))
+        except Exception:
+            out.append(fallback())
+    return out
+
+def generate_report(user: dict, defaults: dict, ctx: MarketContext = None) -> Tuple[str, dict]:
     """
     返回 (markdown, meta)
     meta 含：gen_time, tzname, watchlist_count 等
+    ctx: 多用户共用的 MarketContext；不传则本次单独抓取
     """
+    ctx = ctx or market_context(defaults)
     tzname = pick_user_value(user, defaults, "timezone", "Asia/Shanghai")
     wl     = pick_user_value(user, defaults, "watchlist", [])
     feeds  = pick_user_value(user, defaults, "rss_feeds", [])
     rslim  = int(pick_user_value(user, defaults, "rss_limit", 6))
+    rswork = int(defaults.get("rss_workers", 4))
+    rstout = float(defaults.get("rss_timeout", 10))
+    rsttl  = float(defaults.get("rss_cache_ttl", 600))
+    deadline = float(defaults.get("report_deadline", 30))
 
     gen_time = now_str(tzname)
-    idx   = fetch_index_snapshot()
-    north = fetch_north_money()
-    wlist = fetch_watchlist(wl)
-    rss   = fetch_rss(feeds, limit_per_feed=rslim)
+    # 四路数据互不依赖：并发抓，总时限内没回来的用各自的兜底输出；
+    # 共享行情（key 非空）一旦超时，后面的报告不再等它
+    idx, north, wlist, rss = gather_with_deadline([
+        (lambda: ctx.index, index_placeholder, "index"),
+        (lambda: ctx.north, lambda: {"date": "", "north_net_in": None}, "north"),
+        (lambda: ctx.watchlist(wl), list, "watchlist"),
+        (lambda: fetch_rss(feeds, limit_per_feed=rslim, workers=rswork, timeout=rstout, ttl=rsttl), list, None),
+    ], deadline, ctx)
     md    = render_markdown(gen_time, idx, north, wlist, rss, username=user.get("name") or user.get("id",""))
     meta  = {"gen_time": gen_time, "tz": tzname, "watchlist_count": len(wlist), "rss_count": len(rss)}
     return md, meta
 
 # =================== 仅用于“测试/预览”的 CLI ===================
 def _save(out_dir: Path, uid: str, content: str) -> Path:
-    out_dir.mkdir(parents=True, exist_ok=True)
-    fn = out_dir / f"{uid}_{datetime.now().strftime('%Y%m%d_%H%M')}.md"
-    fn.write_text(content, encoding="utf-8")
+    """
+    文件名带秒和进程号，并发预览互不覆盖；原子写入，不会留下半截文件
+    """
+    fn = out_dir / f"{uid}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.md"
+    atomic_write_text(fn, content)
     return fn
 
+def prune_outputs(out_dir: Path, keep: int = 5, max_age_days: float = 7) -> List[Path]:
+    """
+    输出保留策略：每个用户只留最新 keep 份，且删除超过 max_age_days 天的；
+    keep<=0 / max_age_days<=0 表示不按该条件清理。返回被删除的文件
+    """
+    if not out_dir.is_dir():
+        return []
+    by_uid: Dict[str, List[Tuple[float, Path]]] = {}
+    for fn in out_dir.glob("*.md"):
+        m = re.match(r"(.+)_\d{8}_\d{4,6}(?:_\d+)?$", fn.stem)   # uid_日期_时间[_pid]
+        if not m:
+            continue
+        try:
+            by_uid.setdefault(m.group(1), []).append((fn.stat().st_mtime, fn))
+        except FileNotFoundError:
+            continue
+    cutoff = datetime.now().timestamp() - max_age_days * 86400
+    removed = []
+    for files in by_uid.values():
+        files.sort(reverse=True)
+        for i, (mtime, fn) in enumerate(files):
+            too_many = keep > 0 and i >= keep
+            too_old  = max_age_days > 0 and mtime < cutoff
+            if too_many or too_old:
+                try:
+                    fn.unlink()
+                    removed.append(fn)
+                except FileNotFoundError:
+                    pass    # 另一个预览进程已经删了
+    return removed
+
 if __name__ == "__main__":
     # 仅测试，不发送
     ap = argparse.ArgumentParser(description="预览/测试（不发送）")
-    ap.add_argument("--user", help="只预览指定用户（users.yaml 的 id）")
+    ap.add_argument("--user", help="只预览指定用户（用户 id）")
+    ap.add_argument("--source", choices=USERS_SOURCES, help="用户名单来源（默认取 config.yaml 的 users_source）")
     ap.add_argument("--out-dir", default=str(BASE_DIR / "out"), help="输出目录")
+    ap.add_argument("--keep", type=int, default=5, help="每个用户保留最近几份预览（0 不限）")
+    ap.add_argument("--max-age-days", type=float, default=7, help="删除超过该天数的预览（0 不限）")
     args = ap.parse_args()
 
     defaults = load_yaml(CONFIG_PATH)
-    users_cfg = load_yaml(USERS_PATH)
+    users = load_users(defaults, args.source)
+    net.configure_retry(defaults.get("retry"))
     out_dir = Path(args.out_dir)
+    ctx = market_context(defaults)
 
-    if users_cfg.get("users"):
-        users = users_cfg["users"]
+    if users:
         if args.user:
             users = [u for u in users if str(u.get("id","")) == args.user]
             if not users:
                 print(f"未找到用户 id='{args.user}'")
                 raise SystemExit(2)
+        ctx.prefetch(watchlist_union(users, defaults))
         for u in users:
             uid = u.get("id","user")
-            md, meta = generate_report(u, defaults)
+            md, meta = generate_report(u, defaults, ctx)
             print(f"\n===== [PREVIEW] {uid} ({meta['gen_time']}) =====\n")
             print(md)
             fn = _save(out_dir, uid, md)
             print(f"[PREVIEW] 已保存: {fn}")
     else:
-        # 单用户兼容（没 users.yaml 也能预览）
+        # 单用户兼容（没有任何用户也能预览）
         u = {"id":"single","name":"single"}
-        md, meta = generate_report(u, defaults)
+        md, meta = generate_report(u, defaults, ctx)
         print(f"\n===== [PREVIEW] single ({meta['gen_time']}) =====\n")
         print(md)
         fn = _save(out_dir, "single", md)
         print(f"[PREVIEW] 已保存: {fn}")
+
+    removed = prune_outputs(out_dir, keep=args.keep, max_age_days=args.max_age_days)
+    if removed:
+        print(f"[PREVIEW] 已清理旧预览 {len(removed)} 个")
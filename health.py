@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+health.py — 数据源健康度（跨运行持久化）
+- 记录每个源成功调用的延迟（指数滑动平均）、成功/失败次数、连续失败数
+- 连续失败（含超慢）达到 max_failures 后进入冷却期，冷却期内排到最后
+- order() 按「可用 > 最近没失败 > 平均延迟」给出尝试顺序
+- 熔断器：按上游（AkShare 各接口 / 新浪 / 各 RSS 主机）连续失败后快速失败
+"""
+
+import functools
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fileio import atomic_write_text
+
+class SourceHealth:
+    def __init__(self, path: Optional[Path] = None, cooldown: float = 1800.0, max_failures: int = 3,
+                 slow_after: float = 10.0, alpha: float = 0.3):
+        self.path = Path(path) if path else None
+        self.cooldown = float(cooldown)
+        self.max_failures = int(max_failures)
+        self.slow_after = float(slow_after)
+        self.alpha = float(alpha)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.path:
+            return {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            atomic_write_text(self.path, json.dumps(self.stats, ensure_ascii=False, indent=1))
+        except Exception:
+            pass
+
+    def record(self, source: str, ok: bool, latency: float, error: str = "") -> None:
+        """
+        记录一次调用；成功但超过 slow_after 秒也计作一次失败（用于冷却判断）
+        延迟只取成功的调用：快速失败不会把坏源的平均延迟拉低
+        """
+        with self._lock:
+            st = self.stats.setdefault(source, {"ok": 0, "fail": 0, "consecutive": 0, "cooldown_until": 0.0})
+            if ok:
+                st["latency"] = round(self.alpha * latency + (1 - self.alpha) * st.get("latency", latency), 3)
+            bad = (not ok) or latency > self.slow_after
+            st["ok" if ok else "fail"] = st.get("ok" if ok else "fail", 0) + 1
+            st["consecutive"] = st.get("consecutive", 0) + 1 if bad else 0
+            if error:
+                st["last_error"] = error[:200]
+            if st["consecutive"] >= self.max_failures:
+                st["cooldown_until"] = time.time() + self.cooldown
+                st["consecutive"] = 0
+            elif not bad:
+                st["cooldown_until"] = 0.0
+            self._save()
+
+    def available(self, source: str) -> bool:
+        st = self.stats.get(source) or {}
+        return time.time() >= st.get("cooldown_until", 0.0)
+
+    def order(self, sources: List[str]) -> List[str]:
+        """
+        可用的在前、冷却中的在后；同组内最近一次正常（consecutive 为 0）的在前，
+        再按成功调用的平均延迟升序。没有延迟记录的源排在同组已知源之后，
+        彼此保持原有先后（稳定排序）。失败得再快也不会排到健康源前面
+        """
+        def score(name: str):
+            st = self.stats.get(name) or {}
+            return (not self.available(name), st.get("consecutive", 0) > 0,
+                    st.get("latency", float("inf")))
+        return sorted(sources, key=score)
+
+    def call(self, source: str, fn, valid=bool):
+        """
+        执行 fn 并记录结果；valid(结果) 为假算失败。异常原样抛出
+        CircuitOpen 不记录：没有真正请求上游，失败已由熔断前的调用记过
+        """
+        t0 = time.monotonic()
+        try:
+            out = fn()
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            self.record(source, False, time.monotonic() - t0, repr(e))
+            raise
+        self.record(source, bool(valid(out)), time.monotonic() - t0)
+        return out
+
+# ---------- 熔断器（进程内共享：main.py 全部用户 / 所有 web 请求） ----------
+class CircuitOpen(Exception):
+    """熔断中，直接失败，不再请求上游"""
+
+class CircuitBreaker:
+    """
+    连续 failures 次失败后断开（open），reset 秒后放行一次试探（half-open）：
+    试探成功则恢复（closed），失败则继续断开；试探 reset 秒内没返回则再放一次试探
+    """
+
+    def __init__(self, name: str, failures: int = 3, reset: float = 60.0):
+        self.name = name
+        self.failures = int(failures)
+        self.reset = float(reset)
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # 试探期间不再放行；试探卡住 reset 秒还没结果，再放一次新的试探，不会永远断开
+            if time.monotonic() - self.opened_at >= self.reset:
+                self.state = "half_open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def call(self, fn, valid=None):
+        """
+        熔断中抛 CircuitOpen；fn 抛异常或 valid(结果) 为假记一次失败
+        """
+        if not self.allow():
+            raise CircuitOpen(self.name)
+        try:
+            out = fn()
+        except Exception:
+            self.failure()
+            raise
+        if valid is None or valid(out):
+            self.success()
+        else:
+            self.failure()
+        return out
+
+BREAKER_DEFAULTS = {"failures": 3, "reset": 60.0}
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def breaker(name: str) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        if name not in _BREAKERS:
+            _BREAKERS[name] = CircuitBreaker(name, **BREAKER_DEFAULTS)
+        return _BREAKERS[name]
+
+def configure_breakers(conf: Optional[dict]) -> None:
+    """
+    config.yaml 的 circuit_breaker 段（failures / reset），对已有和之后新建的熔断器都生效
+    """
+    if not conf:
+        return
+    with _BREAKERS_LOCK:
+        BREAKER_DEFAULTS.update({k: v for k, v in conf.items() if k in BREAKER_DEFAULTS})
+        for b in _BREAKERS.values():
+            b.failures = int(BREAKER_DEFAULTS["failures"])
+            b.reset = float(BREAKER_DEFAULTS["reset"])
+
+def guarded(name: str, valid=None):
+    """
+    装饰器：函数调用经过名为 name 的熔断器
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return breaker(name).call(lambda: fn(*args, **kwargs), valid)
+        return wrapper
+    return deco
@@ -2,20 +2,23 @@
 # -*- coding: utf-8 -*-
 """
 main.py — 发送与整合入口（真正推送在这里）
-- 读取 config.yaml / users.yaml / .env
+- 读取 config.yaml / 用户名单（web/app.db 或 users.yaml）/ .env
 - 调用 finance_morning.generate_report() 生成 Markdown
 - 按渠道发送：方糖 / Telegram / 企业微信
 """
 
 import argparse
+import asyncio
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
-import requests
+import net
 from finance_morning import (
-    BASE_DIR, CONFIG_PATH, USERS_PATH,
-    load_yaml, generate_report
+    CONFIG_PATH, USERS_SOURCES,
+    load_yaml, load_users, generate_report, MarketContext, market_context, watchlist_union
 )
 
 ENV_PATH = Path("/home/cwj/code/finace_stock/.env")
@@ -48,7 +51,7 @@ def push_serverchan(sendkey: str, title: str, markdown: str) -> Tuple[int,str]:
     if not sendkey:
         return (0, "No SendKey")
     url = f"https://sctapi.ftqq.com/{sendkey}.send"
-    r = requests.post(url, data={"text": title, "desp": markdown}, timeout=12)
+    r = net.post(url, data={"text": title, "desp": markdown}, timeout=12)
     return (r.status_code, r.text)
 
 def push_telegram(bot_token: str, chat_id: str, title: str, markdown: str) -> Tuple[int,str]:
@@ -56,71 +59,204 @@ def push_telegram(bot_token: str, chat_id: str, title: str, markdown: str) -> Tu
         return (0, "No TG creds")
     url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
     text = f"{title}\n\n{markdown}"
-    r = requests.post(url, json={"chat_id": chat_id, "text": text, "disable_web_page_preview": True}, timeout=15)
+    r = net.post(url, json={"chat_id": chat_id, "text": text, "disable_web_page_preview": True}, timeout=15)
     return (r.status_code, r.text)
 
 def push_wecom(webhook: str, title: str, markdown: str) -> Tuple[int,str]:
     if not webhook:
         return (0, "No WeCom webhook")
     payload = {"msgtype":"markdown","markdown":{"content": f"**{title}**\n\n{markdown}"}}
-    r = requests.post(webhook, json=payload, timeout=12)
+    r = net.post(webhook, json=payload, timeout=12)
     return (r.status_code, r.text)
 
 # ---------- 主流程 ----------
 def parse_args():
     ap = argparse.ArgumentParser(description="早报发送入口（会真正推送）")
-    ap.add_argument("--user", help="只发送给指定用户（users.yaml 的 id）")
+    ap.add_argument("--user", help="只发送给指定用户（用户 id）")
+    ap.add_argument("--source", choices=USERS_SOURCES, help="用户名单来源（默认取 config.yaml 的 users_source）")
+    ap.add_argument("--workers", type=int, default=1, help="并发处理的用户数（默认 1，逐个发送）")
     return ap.parse_args()
 
+# ---------- 限速投递（asyncio 队列 + 令牌桶） ----------
+# rate: 每秒补充的令牌数；burst: 桶容量（允许的瞬时突发）
+DEFAULT_RATE_LIMITS = {
+    "serverchan": {"channel": {"rate": 5,  "burst": 5},  "credential": {"rate": 1, "burst": 5}},
+    "telegram":   {"channel": {"rate": 30, "burst": 30}, "credential": {"rate": 30, "burst": 30},
+                   "chat": {"rate": 1, "burst": 1}},
+    "wecom":      {"channel": {"rate": 20, "burst": 20}, "credential": {"rate": 20/60, "burst": 20}},
+}
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(float(rate), 1e-6)
+        self.capacity = max(float(burst), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class DeliveryEngine:
+    """
+    每个凭据（bot token+chat / webhook / sendkey）一条通道（lane），按序发送；
+    发送前依次拿「渠道 / 凭据 / 会话」三级令牌，不同凭据之间互不阻塞，
+    同时在途的 HTTP 请求数不超过 concurrency。
+    """
+
+    def __init__(self, limits: dict, concurrency: int, executor: ThreadPoolExecutor):
+        self.limits = limits
+        self.executor = executor
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._buckets: Dict[tuple, TokenBucket] = {}
+        self._lanes: Dict[tuple, asyncio.Queue] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def _bucket(self, key: tuple) -> Optional[TokenBucket]:
+        if key not in self._buckets:
+            conf = (self.limits.get(key[0]) or {}).get(key[1])
+            self._buckets[key] = TokenBucket(conf["rate"], conf.get("burst", 1)) if conf else None
+        return self._buckets[key]
+
+    async def submit(self, job: dict) -> Tuple[int, str]:
+        fut = asyncio.get_running_loop().create_future()
+        lane = job["lane"]
+        if lane not in self._lanes:
+            self._lanes[lane] = asyncio.Queue()
+            self._tasks.append(asyncio.create_task(self._run_lane(self._lanes[lane])))
+        await self._lanes[lane].put((job, fut))
+        return await fut
+
+    async def _run_lane(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            job, fut = item
+            try:
+                for key in job["limits"]:
+                    bucket = self._bucket(key)
+                    if bucket:
+                        await bucket.acquire()
+                async with self._sem:
+                    res = await loop.run_in_executor(self.executor, job["send"])
+                fut.set_result(res)
+            except Exception as e:
+                fut.set_exception(e)
+
+    async def close(self) -> None:
+        for q in self._lanes.values():
+            await q.put(None)
+        await asyncio.gather(*self._tasks)
+
+def rate_limits(defaults: dict) -> dict:
+    """
+    config.yaml 的 rate_limits 覆盖默认值（按渠道/层级浅合并）
+    """
+    merged = {ch: dict(v) for ch, v in DEFAULT_RATE_LIMITS.items()}
+    for ch, conf in (defaults.get("rate_limits") or {}).items():
+        merged.setdefault(ch, {}).update(conf or {})
+    return merged
+
+def prepare_job(u: dict, defaults: dict, envmap: dict, ctx: MarketContext) -> Optional[dict]:
+    """
+    生成报告并打包成投递任务；未知渠道返回 None（不计入统计）
+    limits 为令牌桶键：(渠道, 层级, ...凭据)
+    """
+    uid   = u.get("id","user")
+    ch = (u.get("channel") or "serverchan").lower()
+    if ch not in ("serverchan", "telegram", "wecom"):
+        print(f"[{uid}] 未知渠道：{ch}（未发送）")
+        return None
+
+    md, meta = generate_report(u, defaults, ctx)
+    title = f"每日财经早报 | {meta['gen_time']}"
+    secrets = u.get("secrets") or {}
+
+    if ch == "serverchan":
+        sendkey = get_secret(secrets, envmap, "SCT_SENDKEY", "")
+        send = lambda: push_serverchan(sendkey, title, md)
+        limits = [(ch, "channel"), (ch, "credential", sendkey)]
+    elif ch == "telegram":
+        token  = get_secret(secrets, envmap, "BOT_TOKEN", "")
+        chatid = get_secret(secrets, envmap, "CHAT_ID", "")
+        send = lambda: push_telegram(token, chatid, title, md)
+        limits = [(ch, "channel"), (ch, "credential", token), (ch, "chat", token, chatid)]
+    else:
+        webhook = get_secret(secrets, envmap, "WEBHOOK", "")
+        send = lambda: push_wecom(webhook, title, md)
+        limits = [(ch, "channel"), (ch, "credential", webhook)]
+    return {"uid": uid, "channel": ch, "send": send, "limits": limits, "lane": limits[-1]}
+
+async def deliver_all(users: List[dict], defaults: dict, envmap: dict, ctx: MarketContext,
+                      workers: int) -> List[Optional[int]]:
+    """
+    报告生成在 gen 线程池里并发跑，生成一份就进投递队列；返回每个用户的状态码
+    """
+    loop = asyncio.get_running_loop()
+    gen_pool  = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gen")
+    send_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send")
+    engine = DeliveryEngine(rate_limits(defaults), workers, send_pool)
+
+    async def one(u: dict) -> Optional[int]:
+        uid = u.get("id","user")
+        try:
+            job = await loop.run_in_executor(gen_pool, prepare_job, u, defaults, envmap, ctx)
+            if job is None:
+                return None
+            code, text = await engine.submit(job)
+        except Exception as e:
+            # 单个用户出错不影响其他人，计为失败
+            print(f"[{uid}] 发送失败：{e!r}")
+            return 0
+        print(f"[{uid}:{job['channel']}] resp={code} {str(text)[:200]}...")
+        return code
+
+    try:
+        return await asyncio.gather(*(one(u) for u in users))
+    finally:
+        await engine.close()
+        gen_pool.shutdown()
+        send_pool.shutdown()
+
 def main():
     args = parse_args()
     defaults = load_yaml(CONFIG_PATH)
-    users_cfg = load_yaml(USERS_PATH)
+    users     = load_users(defaults, args.source)
     envmap    = load_env(ENV_PATH)
+    net.configure_retry(defaults.get("retry"))
 
-    if users_cfg.get("users"):
-        users = users_cfg["users"]
+    if users:
         if args.user:
             users = [u for u in users if str(u.get("id","")) == args.user]
             if not users:
                 print(f"未找到用户 id='{args.user}'")
                 raise SystemExit(2)
 
-        results = []
-        for u in users:
-            uid   = u.get("id","user")
-            uname = u.get("name") or uid
-            md, meta = generate_report(u, defaults)
-            title = f"每日财经早报 | {meta['gen_time']}"
-
-            ch = (u.get("channel") or "serverchan").lower()
-            secrets = u.get("secrets") or {}
-
-            if ch == "serverchan":
-                sendkey = get_secret(secrets, envmap, "SCT_SENDKEY", "")
-                code, text = push_serverchan(sendkey, title, md)
-                print(f"[{uid}:serverchan] resp={code} {str(text)[:200]}...")
-                results.append(code)
-            elif ch == "telegram":
-                token  = get_secret(secrets, envmap, "BOT_TOKEN", "")
-                chatid = get_secret(secrets, envmap, "CHAT_ID", "")
-                code, text = push_telegram(token, chatid, title, md)
-                print(f"[{uid}:telegram] resp={code} {str(text)[:200]}...")
-                results.append(code)
-            elif ch == "wecom":
-                webhook = get_secret(secrets, envmap, "WEBHOOK", "")
-                code, text = push_wecom(webhook, title, md)
-                print(f"[{uid}:wecom] resp={code} {str(text)[:200]}...")
-                results.append(code)
-            else:
-                print(f"[{uid}] 未知渠道：{ch}（未发送）")
+        ctx = market_context(defaults)  # 行情全员共享，只抓一次
+        # 先抓所有人自选股的并集（一次批量），再分发到各自报告
+        n = ctx.prefetch(watchlist_union(users, defaults))
+        print(f"[watchlist] 自选股并集 {n} 只")
+        workers = max(1, args.workers)
+        net.configure_pool(workers)
+        codes = asyncio.run(deliver_all(users, defaults, envmap, ctx, workers))
+        results = [c for c in codes if c is not None]
 
         ok = sum(1 for c in results if int(c) == 200)
         print(f"\nDone. success={ok}/{len(results)}")
     else:
-        # 单用户兼容（无 users.yaml）
+        # 单用户兼容（没有任何用户）
         u = {"id":"single","name":"single","channel":"serverchan","secrets":{"SCT_SENDKEY":"env:SCT_SENDKEY"}}
-        md, meta = generate_report(u, defaults)
+        md, meta = generate_report(u, defaults, market_context(defaults))
         title = f"每日财经早报 | {meta['gen_time']}"
         sendkey = get_secret(u["secrets"], envmap, "SCT_SENDKEY", "")
         code, text = push_serverchan(sendkey, title, md)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+net.py — 共享 HTTP 连接池
+- 每个目标主机一个 keep-alive 的 requests.Session，多次推送复用 TCP/TLS 连接
+- 连接池大小跟随并发数（main.py --workers）；池满不阻塞，临时多开的连接用完即关
+- 统一重试策略：指数退避 + 抖动，429/503 尊重 Retry-After（抓取与推送共用）；
+  POST 等非幂等请求只在请求确定没发出去、或服务端明确让等（429/503 + Retry-After）时重试
+- requests 在第一次发请求时才导入
+"""
+
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:     # 只给类型注解用，运行时仍按需导入
+    import requests
+
+POOL_MAXSIZE = 10
+
+_SESSIONS: Dict[str, "requests.Session"] = {}
+_LOCK = threading.Lock()
+
+def configure_pool(maxsize: int) -> None:
+    """
+    调整之后新建 Session 保留的连接数；一般在发送前按并发数调用一次（超出的并发不会被卡住）
+    """
+    global POOL_MAXSIZE
+    POOL_MAXSIZE = max(1, int(maxsize))
+
+def get_session(url: str) -> "requests.Session":
+    """
+    按 scheme://host 复用 Session（线程安全地创建，requests 本身可多线程共用）
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _LOCK:
+        sess = _SESSIONS.get(key)
+        if sess is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            sess = requests.Session()
+            # pool_maxsize 只是保留的 keep-alive 连接数；pool_block=False：池满时另开连接、用完丢弃，
+            # 同一主机的请求（如多个 rsshub feed）不会排队等连接、白白耗掉各自的超时
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, pool_block=False)
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            _SESSIONS[key] = sess
+        return sess
+
+# ---------- 重试 ----------
+class RetryPolicy:
+    """
+    attempts: 总尝试次数（含第一次）；第 n 次重试等待 min(backoff*2^n, max_backoff)，
+    再乘以 [1-jitter, 1+jitter] 的随机系数；statuses 中的状态码视为可重试
+    """
+
+    def __init__(self, attempts: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 jitter: float = 0.5, statuses=(429, 500, 502, 503, 504), max_retry_after: float = 60.0):
+        self.attempts = max(1, int(attempts))
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+        self.statuses = frozenset(int(x) for x in statuses)
+        self.max_retry_after = float(max_retry_after)
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(max(retry_after, 0.0), self.max_retry_after)
+        base = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+RETRY = RetryPolicy()
+
+def configure_retry(conf: Optional[dict]) -> RetryPolicy:
+    """
+    用 config.yaml 的 retry 段替换默认策略
+    """
+    global RETRY
+    if conf:
+        RETRY = RetryPolicy(**conf)
+    return RETRY
+
+def _retry_after(resp: "requests.Response") -> Optional[float]:
+    val = resp.headers.get("Retry-After")
+    if val:
+        try:
+            return float(val)
+        except ValueError:
+            pass
+    if resp.status_code == 429:
+        # Telegram 把等待秒数放在 JSON 的 parameters.retry_after
+        try:
+            return float(resp.json()["parameters"]["retry_after"])
+        except Exception:
+            pass
+    return None
+
+def retry_call(fn: Callable, retry_if: Callable = None, policy: RetryPolicy = None):
+    """
+    通用重试：fn 抛异常或 retry_if(结果) 为真时按策略重试；
+    最后一次仍失败则原样抛出 / 返回最后的结果
+    """
+    policy = policy or RETRY
+    for attempt in range(policy.attempts):
+        last = attempt == policy.attempts - 1
+        try:
+            result = fn()
+        except Exception:
+            if last:
+                raise
+            time.sleep(policy.delay(attempt))
+            continue
+        if last or not (retry_if and retry_if(result)):
+            return result
+        time.sleep(policy.delay(attempt))
+
+IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS"})
+
+def _not_sent(exc: Exception) -> bool:
+    """
+    连接阶段就失败（连接超时 / 拒绝 / DNS），请求肯定没发出去，重发不会重复推送；
+    读超时、连接中途被断开则可能服务端已经收到
+    """
+    import requests
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+def request(method: str, url: str, policy: RetryPolicy = None, **kwargs) -> "requests.Response":
+    """
+    走连接池的请求。GET 等幂等请求：连接错误/超时与可重试状态码按策略重试；
+    POST 等：只重试连接阶段的失败，以及带 Retry-After 的 429/503，避免同一条推送发两遍
+    """
+    import requests
+    policy = policy or RETRY
+    idempotent = method.upper() in IDEMPOTENT
+    sess = get_session(url)
+    for attempt in range(policy.attempts):
+        last = attempt == policy.attempts - 1
+        try:
+            resp = sess.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last or not (idempotent or _not_sent(e)):
+                raise
+            time.sleep(policy.delay(attempt))
+            continue
+        if last or resp.status_code not in policy.statuses:
+            return resp
+        wait = _retry_after(resp)
+        if not idempotent and (resp.status_code not in (429, 503) or wait is None):
+            return resp
+        time.sleep(policy.delay(attempt, wait))
+
+def post(url: str, **kwargs) -> "requests.Response":
+    return request("POST", url, **kwargs)
+
+def get(url: str, **kwargs) -> "requests.Response":
+    return request("GET", url, **kwargs)
+
+def close_all() -> None:
+    with _LOCK:
+        for sess in _SESSIONS.values():
+            sess.close()
+        _SESSIONS.clear()
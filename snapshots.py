@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+snapshots.py — 行情快照落盘（Parquet），读穿缓存
+- 布局：<root>/<名称>/<交易日 YYYYMMDD>/<抓取时刻 HHMMSS>.parquet
+- 同一交易日内、未超过 max_age 的快照直接从本地读取，重跑/预览/补发不再重新抓
+- pyarrow 不可用或写入失败时静默退化为直接抓取
+- 另有 Arrow IPC 格式（.arrow）：只读内存映射，多个 web worker 与 main.py
+  共享同一份页缓存，不再各自持有一份全市场 DataFrame
+"""
+
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+MARKET_TZ = "Asia/Shanghai"
+
+# 本进程已映射的 Arrow 文件：名称 -> (路径, Table)，同名只留最新一份
+_MAPPED: dict = {}
+_MAPPED_LOCK = threading.Lock()
+
+def market_now() -> datetime:
+    import pytz
+    return datetime.now(pytz.timezone(MARKET_TZ))
+
+class SnapshotStore:
+    def __init__(self, root: Path, max_age: float = 300.0, keep_days: int = 7):
+        self.root = Path(root)
+        self.max_age = float(max_age)
+        self.keep_days = int(keep_days)
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _name_lock(self, name: str) -> threading.Lock:
+        # 每个快照名一把锁：不同数据集可并行抓取，也允许一个的构建依赖另一个
+        with self._guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _day_dir(self, name: str, when: datetime) -> Path:
+        return self.root / name / when.strftime("%Y%m%d")
+
+    def latest(self, name: str, when: Optional[datetime] = None, suffix: str = ".parquet") -> Optional[Path]:
+        """
+        某交易日（默认今天）最新的一份快照文件
+        """
+        day = self._day_dir(name, when or market_now())
+        files = sorted(day.glob(f"*{suffix}")) if day.is_dir() else []
+        return files[-1] if files else None
+
+    def _fresh(self, name: str, max_age: Optional[float], suffix: str) -> Optional[Path]:
+        """
+        今天且未超过 max_age 的最新文件
+        """
+        max_age = self.max_age if max_age is None else max_age
+        now = market_now()
+        fn = self.latest(name, now, suffix)
+        if fn is None:
+            return None
+        taken = now.replace(hour=int(fn.stem[:2]), minute=int(fn.stem[2:4]), second=int(fn.stem[4:6]),
+                            microsecond=0)
+        if (now - taken).total_seconds() > max_age:
+            return None
+        return fn
+
+    def load(self, name: str, max_age: Optional[float] = None):
+        """
+        今天且未过期的快照 -> DataFrame；否则 None
+        """
+        fn = self._fresh(name, max_age, ".parquet")
+        if fn is None:
+            return None
+        try:
+            import pandas as pd
+            return pd.read_parquet(fn)
+        except Exception:
+            return None
+
+    def save(self, name: str, df) -> Optional[Path]:
+        now = market_now()
+        day = self._day_dir(name, now)
+        fn = day / f"{now.strftime('%H%M%S')}.parquet"
+        try:
+            day.mkdir(parents=True, exist_ok=True)
+            tmp = day / f".{fn.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, fn)
+        except Exception:
+            return None
+        self.prune(name, now)
+        return fn
+
+    def save_arrow(self, name: str, table) -> Optional[Path]:
+        """
+        pyarrow.Table -> 未压缩的 Arrow IPC 文件（可直接内存映射）
+        """
+        now = market_now()
+        day = self._day_dir(name, now)
+        fn = day / f"{now.strftime('%H%M%S')}.arrow"
+        try:
+            import pyarrow as pa
+            day.mkdir(parents=True, exist_ok=True)
+            tmp = day / f".{fn.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with pa.OSFile(str(tmp), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp, fn)
+        except Exception:
+            return None
+        self.prune(name, now)
+        return fn
+
+    def open_arrow(self, name: str, max_age: Optional[float] = None):
+        """
+        今天且未过期的 Arrow 快照 -> 只读内存映射的 pyarrow.Table（零拷贝）；否则 None
+        同一文件在本进程内只映射一次
+        """
+        fn = self._fresh(name, max_age, ".arrow")
+        if fn is None:
+            return None
+        with _MAPPED_LOCK:
+            hit = _MAPPED.get(name)
+            if hit and hit[0] == fn:
+                return hit[1]
+            try:
+                import pyarrow as pa
+                table = pa.ipc.open_file(pa.memory_map(str(fn), "r")).read_all()
+            except Exception:
+                return None
+            _MAPPED[name] = (fn, table)
+            return table
+
+    def read_through_arrow(self, name: str, build: Callable, max_age: Optional[float] = None):
+        """
+        与 read_through 相同，但返回内存映射的 Table；build() 返回 pyarrow.Table 或 None
+        写盘失败时退回 build() 的内存结果
+        """
+        table = self.open_arrow(name, max_age)
+        if table is not None:
+            return table
+        with self._name_lock(name):
+            table = self.open_arrow(name, max_age)
+            if table is not None:
+                return table
+            table = build()
+            if table is None:
+                return None
+            if self.save_arrow(name, table) is None:
+                return table
+            return self.open_arrow(name, max_age) or table
+
+    def prune(self, name: str, now: Optional[datetime] = None) -> None:
+        """
+        删除 keep_days 天以前的交易日目录
+        """
+        if self.keep_days <= 0:
+            return
+        base = self.root / name
+        if not base.is_dir():
+            return
+        cutoff = ((now or market_now()) - timedelta(days=self.keep_days)).strftime("%Y%m%d")
+        for day in base.iterdir():
+            if day.is_dir() and day.name < cutoff:
+                shutil.rmtree(day, ignore_errors=True)
+
+    def read_through(self, name: str, fetch: Callable, max_age: Optional[float] = None):
+        """
+        有新鲜快照就读本地；否则调用 fetch() 抓取并落盘（fetch 返回 None 不落盘）
+        同进程同名并发调用只抓一次
+        """
+        df = self.load(name, max_age)
+        if df is not None:
+            return df
+        with self._name_lock(name):
+            df = self.load(name, max_age)
+            if df is not None:
+                return df
+            df = fetch()
+            if df is not None:
+                self.save(name, df)
+            return df
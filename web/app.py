@@ -1,4 +1,5 @@
 # /web/app.py
+import os
 import re
 from pathlib import Path
 from typing import Optional
@@ -7,9 +8,13 @@ from fastapi import FastAPI, Request, Form, Depends, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.orm import selectinload
 from sqlmodel import SQLModel, create_engine, Session, select
 from passlib.hash import bcrypt
 
+from codes import normalize_code
+from fileio import atomic_write_text, file_lock
+
 # 关键：相对路径更稳
 THIS_DIR = Path(__file__).resolve().parent            # .../finace_stock/web
 PROJECT_ROOT = THIS_DIR.parent                        # .../finace_stock
@@ -19,6 +24,12 @@ CONFIG_YAML = PROJECT_ROOT / "config.yaml"
 
 # 包内相对导入（配合 uvicorn web.app:app）
 from .models import User, Watch, Rss
+from .sessions import SESSION_MAX_AGE, make_sessions
+from finance_morning import load_yaml, users_source
+
+CONF = load_yaml(CONFIG_YAML)
+# main.py 直接读 app.db 时（users_source 不是 yaml）不必每次修改都回写 users.yaml
+EXPORT_YAML = users_source(CONF) == "yaml"
 
 app = FastAPI(debug=True)  # 打开调试，若有模板/导入错误，浏览器会显示详细报错
 app.mount("/static", StaticFiles(directory=str(THIS_DIR / "static")), name="static")
@@ -32,71 +43,105 @@ def init_db():
     SQLModel.metadata.create_all(engine)
 init_db()
 
-# ---- 简易会话（演示用）----
-SESSION: dict[str, str] = {}  # session_id -> uid
+# ---- 会话 ----
+# session_backend（环境变量 SESSION_BACKEND 优先）：sqlite（默认，多 worker 共享）/ cookie / memory，见 sessions.py
+SESSIONS = make_sessions(os.environ.get("SESSION_BACKEND") or CONF.get("session_backend"),
+                         engine, THIS_DIR / ".session_secret")
 
 def current_user(request: Request) -> Optional[User]:
     sid = request.cookies.get("sid")
-    if not sid or sid not in SESSION:
+    uid = SESSIONS.get(sid) if sid else None
+    if not uid:
         return None
-    uid = SESSION[sid]
     with Session(engine) as s:
         return s.exec(select(User).where(User.uid == uid)).first()
 
 def login_user(response: Response, uid: str):
-    import secrets
-    sid = secrets.token_urlsafe(24)
-    SESSION[sid] = uid
-    response.set_cookie("sid", sid, httponly=True, max_age=7*24*3600, samesite="lax")
+    sid = SESSIONS.new(uid)
+    response.set_cookie("sid", sid, httponly=True, max_age=SESSION_MAX_AGE, samesite="lax")
 
-def logout_user(response: Response):
+def logout_user(request: Request, response: Response):
+    sid = request.cookies.get("sid")
+    if sid:
+        SESSIONS.drop(sid)
     response.delete_cookie("sid")
 
 # ---- 工具 ----
-def norm_code(code: str) -> str:
-    if not code: return ""
-    s = code.strip().lower()
-    m = re.search(r"(\d{6})", s)
-    if not m: return ""
-    x = m.group(1)
-    if s.startswith("sh"): return "sh"+x
-    if s.startswith("sz"): return "sz"+x
-    if x.startswith(("600","601","603","605","688","689","900")): return "sh"+x
-    return "sz"+x
+norm_code = normalize_code
 
-def export_users_yaml():
-    import yaml, os
-    data = {"users": []}
-    with Session(engine) as s:
-        users = s.exec(select(User)).all()
-        for u in users:
-            w = s.exec(select(Watch).where(Watch.user_id == u.id)).all()
-            r = s.exec(select(Rss).where(Rss.user_id == u.id)).all()
-            entry = {
-                "id": u.uid,
-                "name": u.name,
-                "timezone": u.timezone,
-                "channel": u.channel,
-                "secrets": {},
-                "watchlist": [i.code for i in w],
-                "rss_feeds": [i.url for i in r],
-            }
-            if u.channel == "serverchan" and u.sct_sendkey:
-                entry["secrets"]["SCT_SENDKEY"] = u.sct_sendkey
-            if u.channel == "telegram":
-                if u.tg_bot_token: entry["secrets"]["BOT_TOKEN"] = u.tg_bot_token
-                if u.tg_chat_id:   entry["secrets"]["CHAT_ID"]   = u.tg_chat_id
-            if u.channel == "wecom" and u.wecom_webhook:
-                entry["secrets"]["WEBHOOK"] = u.wecom_webhook
-            data["users"].append(entry)
-    USERS_YAML.write_text(
-        __import__("yaml").safe_dump(data, allow_unicode=True, sort_keys=False),
-        encoding="utf-8"
+# users.yaml 的内存副本：uid -> 条目（按文件顺序），只在 file_lock(USERS_YAML) 内读写；
+# (inode, mtime) 对不上（别的进程改过）就重读
+_EXPORT = {"stamp": None, "entries": {}}
+
+# 预加载自选股和 RSS：每个集合额外一条 IN 查询，查询数与用户数、条目数无关
+# （不用 joinedload：两个集合一起 JOIN 会得到 自选股×RSS 的笛卡尔积行）
+WITH_LISTS = (selectinload(User.watchlist), selectinload(User.rss))
+
+def _query_user(s: Session, uid: str) -> Optional[User]:
+    return s.exec(select(User).where(User.uid == uid).options(*WITH_LISTS)).first()
+
+def _stamp() -> tuple:
+    st = USERS_YAML.stat()
+    return (st.st_ino, st.st_mtime_ns)    # 原子替换后 inode 必变，比单看 mtime 可靠
+
+def _write_users_yaml(entries: dict):
+    import yaml
+    atomic_write_text(
+        USERS_YAML,
+        yaml.safe_dump({"users": list(entries.values())}, allow_unicode=True, sort_keys=False),
+        mode=0o600,
     )
+    _EXPORT["stamp"] = _stamp()
+
+def _cached_entries() -> Optional[dict]:
+    """
+    内存副本仍与磁盘一致则直接用；否则从 users.yaml 重读（不查库）
+    """
     try:
-        os.chmod(USERS_YAML, 0o600)
-    except Exception:
-        pass
+        stamp = _stamp()
+    except FileNotFoundError:
+        return None
+    if _EXPORT["stamp"] != stamp:
+        import yaml
+        data = yaml.safe_load(USERS_YAML.read_text(encoding="utf-8")) or {}
+        _EXPORT["entries"] = {str(u.get("id")): u for u in data.get("users") or []}
+        _EXPORT["stamp"] = stamp
+    return _EXPORT["entries"]
+
+def _export_all():
+    stmt = select(User).options(*WITH_LISTS).order_by(User.id)
+    with Session(engine) as s:
+        entries = {u.uid: u.to_entry() for u in s.exec(stmt).all()}
+    _EXPORT["entries"] = entries
+    _write_users_yaml(entries)
+
+def export_users_yaml():
+    """
+    全量导出（固定 3 条查询带出所有用户的自选股和 RSS）
+    """
+    with file_lock(USERS_YAML):
+        _export_all()
+
+def export_user(uid: str):
+    """
+    增量导出：只重新生成该用户的条目（固定 3 条查询），其余条目沿用；
+    还没有 users.yaml 时退回全量导出；EXPORT_YAML 关闭时什么都不做
+    """
+    if not EXPORT_YAML:
+        return
+    # 文件锁与 add_user.py / 其它 worker 共用：读磁盘副本 → 改一条 → 原子写回，整段不被插入
+    with file_lock(USERS_YAML):
+        entries = _cached_entries()
+        if entries is None:
+            _export_all()
+            return
+        with Session(engine) as s:
+            u = _query_user(s, uid)
+            if u is None:
+                entries.pop(uid, None)
+            else:
+                entries[uid] = u.to_entry()
+        _write_users_yaml(entries)
 
 # ---- 基础路由 ----
 @app.get("/health")
@@ -132,7 +177,7 @@ def register_post(
         s.add(user); s.commit()
     resp = RedirectResponse("/dashboard", 302)
     login_user(resp, uid)
-    export_users_yaml()
+    export_user(uid)
     return resp
 
 @app.get("/login", response_class=HTMLResponse)
@@ -151,9 +196,9 @@ def login_post(request: Request, uid: str = Form(...), password: str = Form(...)
     return resp
 
 @app.get("/logout")
-def logout():
+def logout(request: Request):
     resp = RedirectResponse("/login", 302)
-    logout_user(resp)
+    logout_user(request, resp)
     return resp
 
 # ---- 仪表盘 & 配置 ----
@@ -161,10 +206,8 @@ def logout():
 def dashboard(request: Request, me: Optional[User] = Depends(current_user)):
     if not me: return RedirectResponse("/login", 302)
     with Session(engine) as s:
-        me = s.exec(select(User).where(User.id == me.id)).first()
-        wlist = s.exec(select(Watch).where(Watch.user_id == me.id)).all()
-        rss = s.exec(select(Rss).where(Rss.user_id == me.id)).all()
-    return templates.TemplateResponse("dashboard.html", {"request": request, "me": me, "wlist": wlist, "rss": rss})
+        me = _query_user(s, me.uid)
+    return templates.TemplateResponse("dashboard.html", {"request": request, "me": me, "wlist": me.watchlist, "rss": me.rss})
 
 @app.post("/profile")
 def update_profile(
@@ -187,7 +230,7 @@ def update_profile(
         u.tg_chat_id = tg_chat_id.strip() or None
         u.wecom_webhook = wecom_webhook.strip() or None
         s.add(u); s.commit()
-    export_users_yaml()
+    export_user(me.uid)
     return RedirectResponse("/dashboard", 302)
 
 @app.post("/watch/add")
@@ -197,7 +240,7 @@ def add_watch(code: str = Form(...), me: Optional[User] = Depends(current_user))
     if not code: raise HTTPException(400, "无效代码")
     with Session(engine) as s:
         s.add(Watch(user_id=me.id, code=code)); s.commit()
-    export_users_yaml()
+    export_user(me.uid)
     return RedirectResponse("/dashboard", 302)
 
 @app.post("/watch/del/{wid}")
@@ -207,7 +250,7 @@ def del_watch(wid: int, me: Optional[User] = Depends(current_user)):
         w = s.get(Watch, wid)
         if w and w.user_id == me.id:
             s.delete(w); s.commit()
-    export_users_yaml()
+    export_user(me.uid)
     return RedirectResponse("/dashboard", 302)
 
 @app.post("/rss/add")
@@ -218,7 +261,7 @@ def add_rss(url: str = Form(...), me: Optional[User] = Depends(current_user)):
         raise HTTPException(400, "RSS 必须是 http/https 链接")
     with Session(engine) as s:
         s.add(Rss(user_id=me.id, url=url)); s.commit()
-    export_users_yaml()
+    export_user(me.uid)
     return RedirectResponse("/dashboard", 302)
 
 @app.post("/rss/del/{rid}")
@@ -228,18 +271,17 @@ def del_rss(rid: int, me: Optional[User] = Depends(current_user)):
         r = s.get(Rss, rid)
         if r and r.user_id == me.id:
             s.delete(r); s.commit()
-    export_users_yaml()
+    export_user(me.uid)
     return RedirectResponse("/dashboard", 302)
 
 @app.get("/preview", response_class=HTMLResponse)
 def preview(request: Request, me: Optional[User] = Depends(current_user)):
     if not me: return RedirectResponse("/login", 302)
-    from finance_morning import load_yaml as fm_load, generate_report
-    defaults = fm_load(CONFIG_YAML)
+    from finance_morning import generate_report, market_context
+    defaults = load_yaml(CONFIG_YAML)
     with Session(engine) as s:
-        u = s.exec(select(User).where(User.id == me.id)).first()
-        wl = [w.code for w in s.exec(select(Watch).where(Watch.user_id == me.id)).all()]
-        rs = [r.url for r in s.exec(select(Rss).where(Rss.user_id == me.id)).all()]
-    u_dict = {"id": u.uid, "name": u.name, "timezone": u.timezone, "watchlist": wl, "rss_feeds": rs}
-    md, meta = generate_report(u_dict, defaults)
+        u = _query_user(s, me.uid)
+    u_dict = {"id": u.uid, "name": u.name, "timezone": u.timezone,
+              "watchlist": [w.code for w in u.watchlist], "rss_feeds": [r.url for r in u.rss]}
+    md, meta = generate_report(u_dict, defaults, market_context(defaults))
     return templates.TemplateResponse("base.html", {"request": request, "content": f"<pre>{md}</pre>"})
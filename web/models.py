@@ -22,6 +22,26 @@ class User(SQLModel, table=True):
     watchlist: List["Watch"] = Relationship(back_populates="user")
     rss: List["Rss"] = Relationship(back_populates="user")
 
+    def to_entry(self) -> dict:
+        """users.yaml 里的一条用户配置（需已加载 watchlist / rss）"""
+        entry = {
+            "id": self.uid,
+            "name": self.name,
+            "timezone": self.timezone,
+            "channel": self.channel,
+            "secrets": {},
+            "watchlist": [i.code for i in self.watchlist],
+            "rss_feeds": [i.url for i in self.rss],
+        }
+        if self.channel == "serverchan" and self.sct_sendkey:
+            entry["secrets"]["SCT_SENDKEY"] = self.sct_sendkey
+        if self.channel == "telegram":
+            if self.tg_bot_token: entry["secrets"]["BOT_TOKEN"] = self.tg_bot_token
+            if self.tg_chat_id:   entry["secrets"]["CHAT_ID"]   = self.tg_chat_id
+        if self.channel == "wecom" and self.wecom_webhook:
+            entry["secrets"]["WEBHOOK"] = self.wecom_webhook
+        return entry
+
 class Watch(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
@@ -33,3 +53,9 @@ class Rss(SQLModel, table=True):
     user_id: int = Field(foreign_key="user.id")
     url: str
     user: Optional[User] = Relationship(back_populates="rss")
+
+class SessionRow(SQLModel, table=True):
+    __tablename__ = "session"
+    sid: str = Field(primary_key=True)            # 写在 cookie 里的随机值
+    uid: str = Field(index=True)                  # 对应 User.uid
+    expires_at: datetime = Field(index=True)      # UTC
@@ -0,0 +1,121 @@
+# /web/sessions.py
+"""
+登录会话的存储后端（可插拔），按 session_backend 选择：
+- sqlite：会话存 app.db 的 session 表；重启不丢，多个 uvicorn worker 共享（默认）
+- cookie：无状态签名 cookie（uid.过期时间.HMAC），服务端不存；密钥取 SESSION_SECRET 或 web/.session_secret
+- memory：进程内 dict，仅单 worker 调试用（原来的做法）
+统一接口：new(uid) -> 写进 cookie 的值；get(value) -> uid 或 None；drop(value)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from fileio import atomic_write_text, file_lock
+from .models import SessionRow
+
+SESSION_BACKENDS = ("sqlite", "cookie", "memory")
+SESSION_MAX_AGE = 7 * 24 * 3600
+
+class MemorySessions:
+    def __init__(self, max_age: int = SESSION_MAX_AGE):
+        self.max_age = max_age
+        self.data: dict[str, tuple[str, float]] = {}   # sid -> (uid, 过期时间)
+
+    def new(self, uid: str) -> str:
+        sid = secrets.token_urlsafe(24)
+        self.data[sid] = (uid, time.time() + self.max_age)
+        return sid
+
+    def get(self, sid: str) -> Optional[str]:
+        uid, exp = self.data.get(sid, (None, 0))
+        return uid if exp > time.time() else None
+
+    def drop(self, sid: str):
+        self.data.pop(sid, None)
+
+class SqliteSessions:
+    def __init__(self, engine, max_age: int = SESSION_MAX_AGE):
+        self.engine = engine
+        self.max_age = max_age
+
+    def new(self, uid: str) -> str:
+        sid = secrets.token_urlsafe(24)
+        now = datetime.utcnow()
+        with Session(self.engine) as s:
+            s.exec(delete(SessionRow).where(SessionRow.expires_at < now))   # 顺手清掉过期会话
+            s.add(SessionRow(sid=sid, uid=uid, expires_at=now + timedelta(seconds=self.max_age)))
+            s.commit()
+        return sid
+
+    def get(self, sid: str) -> Optional[str]:
+        with Session(self.engine) as s:
+            row = s.exec(select(SessionRow).where(SessionRow.sid == sid,
+                                                  SessionRow.expires_at > datetime.utcnow())).first()
+        return row.uid if row else None
+
+    def drop(self, sid: str):
+        with Session(self.engine) as s:
+            s.exec(delete(SessionRow).where(SessionRow.sid == sid))
+            s.commit()
+
+class CookieSessions:
+    """
+    无状态：cookie 自带 uid 和过期时间，用 HMAC-SHA256 签名；任何 worker 只要密钥相同都能验证。
+    服务端没有记录，登出只能删浏览器里的 cookie，已泄露的 cookie 到期前仍有效
+    """
+    def __init__(self, secret: bytes, max_age: int = SESSION_MAX_AGE):
+        self.secret = secret
+        self.max_age = max_age
+
+    def _sign(self, payload: str) -> str:
+        mac = hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(mac).rstrip(b"=").decode()
+
+    def new(self, uid: str) -> str:
+        payload = f"{uid}.{int(time.time()) + self.max_age}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def get(self, value: str) -> Optional[str]:
+        try:
+            payload, sig = value.rsplit(".", 1)
+            uid, exp = payload.rsplit(".", 1)
+            if not hmac.compare_digest(sig, self._sign(payload)) or int(exp) < time.time():
+                return None
+        except (ValueError, TypeError):    # 格式不对 / 非 ASCII
+            return None
+        return uid
+
+    def drop(self, value: str):
+        pass
+
+def load_secret(path: Path) -> bytes:
+    """
+    SESSION_SECRET 环境变量优先；否则用 path 里的密钥，没有就生成一个（权限 600，多个 worker 共用同一份）
+    """
+    env = os.environ.get("SESSION_SECRET")
+    if env:
+        return env.encode()
+    with file_lock(path):
+        if not path.exists():
+            atomic_write_text(path, secrets.token_urlsafe(48), mode=0o600)
+        return path.read_text(encoding="utf-8").strip().encode()
+
+def make_sessions(backend: str, engine, secret_path: Path, max_age: int = SESSION_MAX_AGE):
+    backend = (backend or "sqlite").lower()
+    if backend == "sqlite":
+        return SqliteSessions(engine, max_age)
+    if backend == "cookie":
+        return CookieSessions(load_secret(secret_path), max_age)
+    if backend == "memory":
+        return MemorySessions(max_age)
+    raise ValueError(f"session_backend 只能是 {'/'.join(SESSION_BACKENDS)}：{backend}")